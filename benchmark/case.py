@@ -0,0 +1,167 @@
+"""
+在合成数据的workspace中运行单个测试用例，结果写入json文件。
+由benchmark.run在workspace目录下以独立进程调用，每个用例都从未预热的进程开始。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import statistics
+from inspect import unwrap
+
+import numpy as np
+
+
+def timeit(func, repeat):
+    """
+    重复调用func，返回各次耗时（秒）的最小值和中位数。
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), statistics.median(seconds)
+
+
+def domain_cells():
+    from meic2ctm.config import config
+
+    return config.getint('projection', 'xcells') * config.getint('projection', 'ycells')
+
+
+def run_pipeline(writer, cold):
+    """
+    端到端生成一天的输出文件。cold为True时先清空磁盘缓存（asc二进制缓存、投影网格、省份栅格等）。
+
+    Returns:
+        dict: 耗时、时次数、吞吐量（网格·小时/秒）、峰值内存和各阶段统计。
+
+    """
+    from meic2ctm.config import config
+    from meic2ctm.profiling import peak_rss, profiler
+    from meic2ctm.runner import Target, run, writers
+
+    if cold:
+        shutil.rmtree(config.get('base', 'cache_path'), ignore_errors=True)
+    day = config.get('time', 'start_date')
+    writer_module = writers[writer]
+    hours = len(writer_module.file_times(writer_module.first_time(datetime.datetime.strptime(day, '%Y-%m-%d'))))
+
+    profiler.enable()
+    start = time.perf_counter()
+    run([Target(writer, writer)], day, day, force=True)
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'hours': hours,
+        'cells': domain_cells(),
+        'cell_hours_per_sec': domain_cells() * hours / seconds,
+        'peak_rss': peak_rss(),
+        'stages': profiler.snapshot(),
+    }
+
+
+def micro_projection_base(repeat):
+    from meic2ctm.cache import cache_dir
+    from meic2ctm.config import config
+    from meic2ctm.projection import projection_base
+
+    version = config.get('inventory', 'mix_inventory_version')
+
+    def cold():
+        shutil.rmtree(cache_dir('projection'), ignore_errors=True)
+        projection_base.cache_clear()
+        projection_base(version)
+
+    def warm():
+        projection_base.cache_clear()
+        projection_base(version)
+
+    return {
+        'projection_base (compute)': (timeit(cold, repeat), domain_cells(), 'cells'),
+        'projection_base (disk cache)': (timeit(warm, repeat), domain_cells(), 'cells'),
+    }
+
+
+def micro_control_factor(repeat):
+    from meic2ctm.config import config
+    from meic2ctm.factor import load_control_factor
+    from meic2ctm.geo import load_province_grid
+
+    year, month = (int(part) for part in config.get('time', 'start_date').split('-')[:2])
+    control_file_path = './factor/control_bench.csv'
+    # 省份栅格在首次调用时计算并缓存，此处只测系数网格的生成
+    load_province_grid()
+    func = unwrap(load_control_factor)
+    return {
+        'load_control_factor': (timeit(lambda: func(control_file_path, 'power', year, month, 'SO2'), repeat),
+                                domain_cells(), 'cells'),
+    }
+
+
+def micro_temporal(repeat):
+    from meic2ctm.config import config
+    from meic2ctm.factor import calc_day_factor, calc_time_factors, load_layer_weight
+    from meic2ctm.temporal import allocate
+
+    sectors = config.get('base', 'sectors').split(',')
+    year, month, day = (int(part) for part in config.get('time', 'start_date').split('-'))
+    times = [datetime.datetime(year, month, day) + datetime.timedelta(hours=hour) for hour in range(25)]
+    ycells, xcells = config.getint('projection', 'ycells'), config.getint('projection', 'xcells')
+
+    rng = np.random.default_rng(0)
+    surface = rng.random((len(sectors), ycells, xcells), dtype=np.float32)
+    profiles = np.stack([load_layer_weight('cmaq', sector) for sector in sectors])
+    factors = calc_time_factors(sectors, times)
+    func = unwrap(allocate)
+
+    return {
+        'calc_day_factor': (timeit(lambda: calc_day_factor.__wrapped__(year, month), repeat), 1, 'months'),
+        'calc_time_factors': (timeit(lambda: calc_time_factors(sectors, times), repeat), len(times), 'hours'),
+        'allocate (hourly accumulation)': (timeit(lambda: func(surface, profiles, factors), repeat),
+                                           ycells * xcells * len(times), 'cell-hours'),
+    }
+
+
+def run_micro(repeat):
+    """
+    热点函数的微基准。各函数绕过lru_cache和数组缓存直接调用。
+
+    Returns:
+        dict: 函数名到 {'min', 'median', 'work', 'unit', 'per_sec'} 的映射，per_sec为按最小耗时计算的吞吐量。
+
+    """
+    results = {}
+    for bench in (micro_projection_base, micro_control_factor, micro_temporal):
+        for name, ((best, median), work, unit) in bench(repeat).items():
+            results[name] = {'min': best, 'median': median, 'work': work, 'unit': unit, 'per_sec': work / best}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run one benchmark case in the current workspace.')
+    parser.add_argument('case', choices=['cmaq', 'wrfchem', 'micro'])
+    parser.add_argument('--cold', help='clear the disk cache before running', action='store_true')
+    parser.add_argument('--repeat', help='repetitions of each microbenchmark', type=int, default=5)
+    parser.add_argument('--json', help='write the result to this file', required=True)
+    args = parser.parse_args()
+
+    from meic2ctm.api import configure
+
+    configure('config.ini')
+    # 进度输出不影响结果
+    sys.stdout = open(os.devnull, 'w')
+    if args.case == 'micro':
+        result = run_micro(args.repeat)
+    else:
+        result = run_pipeline(args.case, args.cold)
+    with open(args.json, 'w') as f:
+        json.dump(result, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import platform
+import argparse
+import datetime
+import subprocess
+import tempfile
+
+import numpy as np
+
+from benchmark.synthetic import domains, generate, repo_dir
+
+default_baseline = os.path.join(repo_dir, 'benchmark', 'baselines', 'reference.json')
+
+
+def run_case(workspace, case, *options):
+    """
+    在workspace目录下以独立进程运行一个测试用例，避免各用例共享缓存。
+
+    Returns:
+        dict: 用例结果。
+
+    """
+    result_path = os.path.join(workspace, f'result_{case}.json')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_dir, os.environ.get('PYTHONPATH')])))
+    subprocess.run([sys.executable, '-m', 'benchmark.case', case, '--json', result_path, *options], cwd=workspace,
+                   env=env, check=True)
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def run_size(workspace, warm_runs, repeat):
+    """
+    依次运行CMAQ和WRF-Chem的端到端测试及微基准。端到端测试先在清空磁盘缓存后运行一次（cold），
+    再运行warm_runs次（warm，磁盘缓存已生成但进程内缓存为空），warm取最快的一次。
+    """
+    results = {}
+    for writer in ('cmaq', 'wrfchem'):
+        cold = run_case(workspace, writer, '--cold')
+        warm = min((run_case(workspace, writer) for _ in range(warm_runs)), key=lambda result: result['seconds'])
+        results[writer] = {'cold': cold, 'warm': warm}
+    results['micro'] = run_case(workspace, 'micro', '--repeat', str(repeat))
+    return results
+
+
+def metrics(results):
+    """
+    将结果展开为 {名称: (耗时, 吞吐量, 单位)}，用于打印和与基准比较。
+    """
+    rows = {}
+    for size, size_results in results.items():
+        for writer in ('cmaq', 'wrfchem'):
+            for mode in ('cold', 'warm'):
+                result = size_results[writer][mode]
+                rows[f'{size}/{writer}/{mode}'] = (result['seconds'], result['cell_hours_per_sec'], 'cell-hours')
+        for name, result in size_results['micro'].items():
+            rows[f'{size}/{name}'] = (result['min'], result['per_sec'], result['unit'])
+    return rows
+
+
+def compare(results, baseline, max_slowdown):
+    """
+    打印本次结果并与基准结果比较。ratio为本次耗时与基准耗时之比，大于1表示变慢。
+
+    Returns:
+        list: 变慢超过max_slowdown的项目名称。
+
+    """
+    current = metrics(results)
+    reference = metrics(baseline['results']) if baseline else {}
+    regressions = []
+    print(f'{"case":<48}{"seconds":>10}{"throughput/s":>16}  {"unit":<12}{"baseline":>10}{"ratio":>8}')
+    for name, (seconds, per_sec, unit) in current.items():
+        line = f'{name:<48}{seconds:>10.4f}{per_sec:>16.4g}  {unit:<12}'
+        if name in reference:
+            ratio = seconds / reference[name][0]
+            line += f'{reference[name][0]:>10.4f}{ratio:>8.2f}'
+            if ratio > 1 + max_slowdown:
+                line += '  SLOWER'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def environment():
+    # 记录运行环境，不同机器上的结果不宜直接比较
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                                  text=True).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end-to-end and microbenchmarks on synthetic MEIC/MIX inputs.')
+    parser.add_argument('-s', '--sizes', help='domain sizes to run', nargs='+', choices=list(domains),
+                        default=list(domains))
+    parser.add_argument('-d', '--workdir', help='directory of the generated synthetic inputs',
+                        default=os.path.join(tempfile.gettempdir(), 'meic2ctm-bench'))
+    parser.add_argument('-m', '--mix-version', help='MIX inventory version of the synthetic inputs',
+                        choices=['1', '2'], default='1')
+    parser.add_argument('--warm-runs', help='warm end-to-end runs per pipeline, the fastest is kept', type=int,
+                        default=2)
+    parser.add_argument('--repeat', help='repetitions of each microbenchmark', type=int, default=5)
+    parser.add_argument('-b', '--baseline', help='baseline result file to compare with', default=default_baseline)
+    parser.add_argument('--save-baseline', help='store this run as the baseline', action='store_true')
+    parser.add_argument('-o', '--output', help='also write the results to this json file', default=None)
+    parser.add_argument('--max-slowdown', help='exit with an error when a case is slower than the baseline '
+                                               'by more than this fraction', type=float, default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        workspace = os.path.join(args.workdir, f'{size}_mix_v{args.mix_version}')
+        print(f'prepare synthetic inputs: {workspace}')
+        generate(workspace, size, args.mix_version)
+        print(f'run benchmark: {size}')
+        results[size] = run_size(workspace, args.warm_runs, args.repeat)
+    report = {'environment': environment(), 'results': results}
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f'baseline: {args.baseline} ({baseline["environment"]["date"]}, '
+              f'revision {baseline["environment"]["revision"]})')
+    regressions = compare(results, baseline, args.max_slowdown if args.max_slowdown is not None else float('inf'))
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'results written to {path}')
+
+    if regressions:
+        print(f'{len(regressions)} cases slower than the baseline by more than {args.max_slowdown:.0%}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import os
+import shutil
+import calendar
+import configparser
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sectors = ['transportation', 'residential', 'power', 'industry', 'agriculture']
+
+# 各测试规模的模拟域，网格中心位于Lambert投影原点（110E, 34N），均在MIX清单和MEIC的覆盖范围内
+domains = {
+    'small': {'dx': 36000, 'xcells': 60, 'ycells': 45},
+    'medium': {'dx': 36000, 'xcells': 172, 'ycells': 127},
+    '3km': {'dx': 3000, 'xcells': 500, 'ycells': 400},
+}
+
+# MIX清单的全球网格 (lat, lon)，与projection.mix_axes一致
+mix_shapes = {'1': (441, 560), '2': (750, 940)}
+
+mix_v1_sectors = {
+    'power': 'POWER',
+    'transportation': 'TRANSPORT',
+    'residential': 'RESIDENTIAL',
+    'industry': 'INDUSTRY',
+    'agriculture': 'AGRICULTURE'
+}
+
+# 合成的省份，(2位行政区划代码, 经度范围, 纬度范围)
+provinces = [
+    (11, (100, 110), (20, 35)),
+    (12, (110, 125), (20, 35)),
+    (13, (100, 110), (35, 50)),
+    (51, (110, 135), (35, 50)),
+]
+
+
+def inventory_species():
+    """
+    CMAQ和WRF-Chem机制所需的清单物种，即MEIC asc文件和MIX文件的物种名。
+    PM组分由PM2.5拆分、PMcoarse由PM10减PM2.5得到，均不单独提供文件。
+
+    Returns:
+        list: 清单物种名称。
+
+    """
+    species = set()
+    pm_species = set()
+    for basedir in ('cmaq', 'wrfchem'):
+        species |= set(pd.read_csv(os.path.join(repo_dir, 'factor', basedir, 'species-map.csv')).columns[1:])
+        pm_species |= set(pd.read_csv(os.path.join(repo_dir, 'factor', basedir, 'pm25factor.csv')).columns[1:])
+    return sorted((species - pm_species - {'PMcoarse'}) | {'PM10', 'PM25'})
+
+
+def smooth_field(shape, rng, scale):
+    """
+    由若干高斯排放中心叠加而成的平滑场，保留两位有效小数，便于压缩且各次生成结果一致。
+    """
+    rows, cols = np.meshgrid(np.linspace(0, 1, shape[0]), np.linspace(0, 1, shape[1]), indexing='ij')
+    field = np.zeros(shape)
+    for _ in range(6):
+        y, x, width = rng.random(3)
+        field += np.exp(-((rows - y) ** 2 + (cols - x) ** 2) / (0.02 + 0.1 * width))
+    return np.round(field * scale, 2).astype(np.float32)
+
+
+def write_config(workspace, domain, mix_version, year, month):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(repo_dir, 'config.ini'))
+    dx = domain['dx']
+    xcells, ycells = domain['xcells'], domain['ycells']
+    day = min(15, calendar.monthrange(year, month)[1])
+    config.set('base', 'output_path', 'output')
+    config.set('base', 'cache_path', 'cache')
+    config.set('inventory', 'mix_inventory_version', mix_version)
+    config.set('inventory', 'mix_inventory_year', '2008')
+    config.set('time', 'start_date', f'{year}-{month:02d}-{day:02d}')
+    config.set('time', 'end_date', f'{year}-{month:02d}-{day:02d}')
+    config.set('projection', 'xorig', f'{-xcells * dx / 2:.3f}')
+    config.set('projection', 'yorig', f'{-ycells * dx / 2:.3f}')
+    config.set('projection', 'dx', str(dx))
+    config.set('projection', 'dy', str(dx))
+    config.set('projection', 'xcells', str(xcells))
+    config.set('projection', 'ycells', str(ycells))
+    with open(os.path.join(workspace, 'config.ini'), 'w') as f:
+        config.write(f)
+
+
+def write_factors(workspace, year, month, species):
+    # 复制内置的分配系数，并生成合成的省界和调控系数文件
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    factor_dir = os.path.join(workspace, 'factor')
+    shutil.copytree(os.path.join(repo_dir, 'factor'), factor_dir, ignore=shutil.ignore_patterns('shp'))
+    os.makedirs(os.path.join(factor_dir, 'shp'))
+    gdf = gpd.GeoDataFrame({'pr_adcode': [f'{code}0000' for code, _, _ in provinces]},
+                           geometry=[box(lon[0], lat[0], lon[1], lat[1]) for _, lon, lat in provinces],
+                           crs='EPSG:4326')
+    gdf.to_file(os.path.join(factor_dir, 'shp', 'province.shp'))
+
+    records = [{'sector': sector, 'adcode': code, 'year': year, 'month': month, 'species': spec,
+                'factor': 0.5 + 0.1 * i}
+               for i, (code, _, _) in enumerate(provinces)
+               for sector in sectors
+               for spec in species if spec in ('SO2', 'NOx', 'PM25', 'CB05_PAR')]
+    pd.DataFrame.from_records(records).to_csv(os.path.join(factor_dir, 'control_bench.csv'), index=False)
+
+
+def write_meic(workspace, domain, year, month, species, rng):
+    dx = domain['dx']
+    xcells, ycells = domain['xcells'], domain['ycells']
+    header = (f'ncols {xcells}\nnrows {ycells}\nxllcorner {-xcells * dx // 2}\nyllcorner {-ycells * dx // 2}\n'
+              f'cellsize {dx}\nNODATA_value -9999')
+    # 排放量按网格面积缩放，使不同分辨率下的排放强度相近
+    scale = (dx / 36000) ** 2
+    meic_dir = os.path.join(workspace, 'input', 'MEIC', str(year))
+    os.makedirs(meic_dir, exist_ok=True)
+    for sector in sectors:
+        for spec in species:
+            data = smooth_field((ycells, xcells), rng, scale * (2 if spec == 'PM10' else 1))
+            np.savetxt(os.path.join(meic_dir, f'{year}_{month:02d}_{sector}_{spec}.asc'), data, fmt='%.4g',
+                       header=header, comments='')
+
+
+def write_mix(workspace, mix_version, month, species, rng):
+    """
+    生成MIX清单文件。只写入所需月份的数据，其余月份为未写入的压缩块，不占用磁盘空间。
+    """
+    shape = mix_shapes[mix_version]
+    if mix_version == '1':
+        mix_dir = os.path.join(workspace, 'input', 'MIX', 'MIX_V1', 'MIX_2008')
+    else:
+        mix_dir = os.path.join(workspace, 'input', 'MIX', 'MIX_V2', '2008')
+    os.makedirs(mix_dir, exist_ok=True)
+
+    for spec in species:
+        if mix_version == '1':
+            path = os.path.join(mix_dir, f'MICS_Asia_{spec}_2008_0.25x0.25.nc')
+            var_names = {sector: f'{"PM2.5" if spec == "PM25" else spec}_{mix_v1_sectors[sector]}'
+                         for sector in sectors}
+        else:
+            path = os.path.join(mix_dir, f'MIXv2.3_{spec}_2008_monthly_0.1deg.nc')
+            var_names = {sector: f'{spec}_{sector.title()}' for sector in sectors}
+        with nc.Dataset(path, 'w') as f:
+            f.createDimension('time', 12)
+            f.createDimension('lat', shape[0])
+            f.createDimension('lon', shape[1])
+            for sector in sectors:
+                var = f.createVariable(var_names[sector], 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=1,
+                                       chunksizes=(1, *shape))
+                var[month - 1] = smooth_field(shape, rng, 2 if spec == 'PM10' else 1)
+
+
+def generate(workspace, size, mix_version='1', year=2020, month=7, seed=0):
+    """
+    在workspace下生成一套可直接运行的合成输入：config.ini、factor目录、MEIC asc和MIX文件。
+    已生成的workspace不会重复生成。
+
+    Args:
+        workspace (str): 生成目录，程序需在该目录下运行。
+        size (str): 模拟域规模，domains中的键。
+        mix_version (str): MIX清单版本，'1' 或 '2'。
+        year (int): MEIC清单年份。
+        month (int): 生成数据的月份，测试在该月15日运行。
+        seed (int): 随机数种子。
+
+    Returns:
+        str: workspace路径。
+
+    """
+    marker = os.path.join(workspace, '.complete')
+    if os.path.exists(marker):
+        return workspace
+    if os.path.exists(workspace):
+        shutil.rmtree(workspace)
+    os.makedirs(workspace)
+
+    domain = domains[size]
+    species = inventory_species()
+    rng = np.random.default_rng(seed)
+    write_config(workspace, domain, mix_version, year, month)
+    write_factors(workspace, year, month, species)
+    write_meic(workspace, domain, year, month, species, rng)
+    write_mix(workspace, mix_version, month, species, rng)
+
+    with open(marker, 'w') as f:
+        f.write(f'{size} mix_v{mix_version} {year}-{month:02d}\n')
+    return workspace
@@ -0,0 +1,198 @@
+import os
+import sys
+import glob
+import json
+import argparse
+
+from meic2ctm import service, shard
+from meic2ctm.api import configure, generate
+from meic2ctm.config import config
+from meic2ctm.domain import domain_names, meic_path, use_domain
+from meic2ctm.ensemble import run_ensemble
+from meic2ctm.meic import read_asc
+from meic2ctm.profiling import profiler
+from meic2ctm.runner import Target, parse_target
+
+
+def warm(args):
+    # 预先把全年各模拟域的asc文件转存为npy缓存
+    for name in domain_names():
+        with use_domain(name):
+            for month in args.months:
+                asc_files = sorted(glob.glob(os.path.join(meic_path(args.year),
+                                                          f'{args.year}_{str(month).zfill(2)}_*.asc')))
+                for asc_file in asc_files:
+                    read_asc(asc_file)
+                print(f'warm cache: {name} {args.year}-{str(month).zfill(2)} {len(asc_files)} files')
+
+
+def single(args):
+    # 单一输出格式，模型机制取配置中的model
+    generate(targets=[Target(args.command, config.get('base', 'model'))], start=args.start, end=args.end,
+             workers=args.workers, resume=args.resume, force=args.force)
+
+
+def multi(args):
+    # 一次计算同时写出多个输出目标
+    generate(targets=args.targets, start=args.start, end=args.end, workers=args.workers, resume=args.resume,
+             force=args.force)
+
+
+def ensemble(args):
+    # 同一基准排放应用多个调控方案
+    start = args.start if args.start else config.get('time', 'start_date')
+    end = args.end if args.end else config.get('time', 'end_date')
+    run_ensemble(args.control_files, [parse_target(target) for target in args.targets], start, end, args.workers,
+                 args.resume, args.force)
+
+
+def serve(args):
+    # 常驻服务，缓存在任务间保留
+    service.serve(args.host, args.port, args.jobs)
+
+
+def submit(args):
+    request = {'start': args.start, 'end': args.end or args.start}
+    if args.targets:
+        request['targets'] = args.targets
+    if args.output_path:
+        request['output_path'] = args.output_path
+    if args.no_control:
+        request['control_file'] = None
+    elif args.control_file:
+        request['control_file'] = args.control_file
+    request['force'] = args.force
+    job = service.submit(args.url, request, wait_done=not args.no_wait)
+    print(json.dumps(job, indent=1))
+    if job['status'] == 'failed':
+        sys.exit(1)
+
+
+def plan(args):
+    # 按月切分时段，输出作业数组各分片的命令行参数或配置文件
+    start = args.start if args.start else config.get('time', 'start_date')
+    end = args.end if args.end else config.get('time', 'end_date')
+    shards = shard.plan_shards(start, end, args.months, args.shards)
+    if args.index is not None:
+        if not 0 <= args.index < len(shards):
+            sys.exit(f'shard index {args.index} out of range, {len(shards)} shards planned')
+        shards = [shards[args.index]]
+    if args.config_dir:
+        for path in shard.write_shard_configs(shards, args.config_dir):
+            print(path)
+    elif args.json:
+        print(json.dumps([{'start': start, 'end': end} for start, end in shards], indent=1))
+    else:
+        for start, end in shards:
+            print(f'-s {start} -e {end}')
+
+
+def verify(args):
+    # 检查输出文件是否齐全
+    start = args.start if args.start else config.get('time', 'start_date')
+    end = args.end if args.end else config.get('time', 'end_date')
+    total, problems = shard.verify([parse_target(target) for target in args.targets], start, end)
+    for name, problem in problems:
+        print(f'{name}: {problem}')
+    print(f'{total - len(problems)} of {total} files complete')
+    if problems:
+        sys.exit(1)
+
+
+def add_run_arguments(parser, workers_help='number of worker processes'):
+    # 各生成命令共用的参数
+    parser.add_argument('-s', '--start', help='change the start datetime', type=str, default=None)
+    parser.add_argument('-e', '--end', help='change the end datetime', type=str, default=None)
+    parser.add_argument('-w', '--workers', help=workers_help, type=int, default=1)
+    parser.add_argument('-r', '--resume', help='continue after the last completed file', action='store_true')
+    parser.add_argument('-f', '--force', help='regenerate all files ignoring the manifest', action='store_true')
+    parser.add_argument('--profile', help='print time, memory and cache statistics of each stage',
+                        action='store_true')
+    parser.add_argument('--profile-json', help='also write the profile report to this json file', type=str,
+                        default=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='meic2ctm', description='MEIC emission processor for CTMs.')
+    parser.add_argument('--config', help='configuration file', type=str, default='config.ini')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for writer in ('cmaq', 'wrfchem'):
+        single_parser = subparsers.add_parser(writer,
+                                              help=f'write {writer} emission files using the configured model')
+        add_run_arguments(single_parser)
+        single_parser.set_defaults(func=single)
+
+    warm_parser = subparsers.add_parser('warm', help='convert MEIC asc files of a year into the binary cache')
+    warm_parser.add_argument('-y', '--year', help='MEIC inventory year', type=int, required=True)
+    warm_parser.add_argument('-m', '--months', help='months to warm, default all', type=int, nargs='+',
+                             default=list(range(1, 13)))
+    warm_parser.set_defaults(func=warm)
+
+    multi_parser = subparsers.add_parser('multi', help='write several output formats from one computation')
+    multi_parser.add_argument('-t', '--targets', help='output targets as writer[:model], e.g. cmaq wrfchem',
+                              nargs='+', default=['cmaq', 'wrfchem'])
+    add_run_arguments(multi_parser)
+    multi_parser.set_defaults(func=multi)
+
+    ensemble_parser = subparsers.add_parser('ensemble', help='apply several control files against one baseline')
+    ensemble_parser.add_argument('-c', '--control-files', help='control csv files, one output directory each',
+                                 nargs='+', required=True)
+    ensemble_parser.add_argument('-t', '--targets', help='output targets as writer[:model], e.g. cmaq wrfchem',
+                                 nargs='+', default=['cmaq'])
+    add_run_arguments(ensemble_parser, workers_help='number of scenarios run in parallel')
+    ensemble_parser.set_defaults(func=ensemble)
+
+    serve_parser = subparsers.add_parser('serve', help='run as a service keeping caches warm between jobs')
+    serve_parser.add_argument('--host', help='address to listen on', type=str, default='127.0.0.1')
+    serve_parser.add_argument('--port', help='port to listen on', type=int, default=8642)
+    serve_parser.add_argument('-j', '--jobs', help='number of jobs run at the same time', type=int, default=1)
+    serve_parser.set_defaults(func=serve)
+
+    submit_parser = subparsers.add_parser('submit', help='submit a job to a running service')
+    submit_parser.add_argument('-s', '--start', help='start date', type=str, required=True)
+    submit_parser.add_argument('-e', '--end', help='end date, default the start date', type=str, default=None)
+    submit_parser.add_argument('-t', '--targets', help='output targets as writer[:model], default cmaq', nargs='+',
+                               default=None)
+    submit_parser.add_argument('-o', '--output-path', help='output directory, default that of the service',
+                               type=str, default=None)
+    submit_parser.add_argument('--control-file', help='control csv file, default that of the service', type=str,
+                               default=None)
+    submit_parser.add_argument('--no-control', help='do not apply any control file', action='store_true')
+    submit_parser.add_argument('-f', '--force', help='regenerate all files ignoring the manifest',
+                               action='store_true')
+    submit_parser.add_argument('--no-wait', help='return after the job is queued', action='store_true')
+    submit_parser.add_argument('--url', help='service address', type=str, default='http://127.0.0.1:8642')
+    submit_parser.set_defaults(func=submit)
+
+    plan_parser = subparsers.add_parser('plan', help='split the period into month-aligned shards for a job array')
+    plan_parser.add_argument('-s', '--start', help='change the start datetime', type=str, default=None)
+    plan_parser.add_argument('-e', '--end', help='change the end datetime', type=str, default=None)
+    plan_parser.add_argument('-m', '--months', help='months per shard', type=int, default=1)
+    plan_parser.add_argument('-n', '--shards', help='number of shards, overrides --months', type=int, default=None)
+    plan_parser.add_argument('-i', '--index', help='print only this shard (0-based), e.g. a job array index',
+                             type=int, default=None)
+    plan_parser.add_argument('--config-dir', help='write one config file per shard to this directory', type=str,
+                             default=None)
+    plan_parser.add_argument('--json', help='print the shards as json', action='store_true')
+    plan_parser.set_defaults(func=plan)
+
+    verify_parser = subparsers.add_parser('verify', help='check that every expected output file is complete')
+    verify_parser.add_argument('-t', '--targets', help='output targets as writer[:model], e.g. cmaq wrfchem',
+                               nargs='+', default=['cmaq'])
+    verify_parser.add_argument('-s', '--start', help='change the start datetime', type=str, default=None)
+    verify_parser.add_argument('-e', '--end', help='change the end datetime', type=str, default=None)
+    verify_parser.set_defaults(func=verify)
+
+    args = parser.parse_args(argv)
+    configure(args.config)
+    profile = getattr(args, 'profile', False)
+    if profile:
+        profiler.enable()
+    args.func(args)
+    if profile:
+        profiler.finish(args.profile_json)
+
+
+if __name__ == '__main__':
+    main()
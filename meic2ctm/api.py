@@ -0,0 +1,69 @@
+from .cache import array_cache, cache_key, clear_caches
+from .config import config, load_config
+from .mix import close_mix
+from .runner import Target, parse_target, run
+
+# 只影响写出而不影响进程内缓存内容的配置项和配置节，修改后无需清空缓存
+run_options = {
+    ('base', 'output_path'),
+    ('base', 'model'),
+    ('base', 'cache_max_mb'),
+    ('base', 'tag_sectors'),
+    ('base', 'output_format'),
+    ('base', 'compress_level'),
+    ('base', 'shuffle'),
+    ('inventory', 'control_file'),
+}
+
+run_sections = {'time', 'wrfchem'}
+
+
+def cache_signature():
+    return cache_key(sorted((section, option, value)
+                            for section in config.sections()
+                            for option, value in config.items(section, raw=True)
+                            if section not in run_sections and (section, option) not in run_options))
+
+
+def configure(settings='config.ini'):
+    """
+    加载配置。与当前配置相比，影响中间结果的配置项（投影、清单、部门等）改变时清空进程内缓存；
+    只改变输出路径、起止日期、调控文件等时保留缓存，同一进程中的多次运行可复用已加载的数据。
+
+    Args:
+        settings (str | dict | configparser.ConfigParser): 配置文件路径、字典或ConfigParser，同load_config。
+
+    """
+    previous = cache_signature() if config.sections() else None
+    load_config(settings)
+    array_cache.max_bytes = config.getint('base', 'cache_max_mb', fallback=4096) * 2 ** 20
+    if cache_signature() != previous:
+        close_mix()
+        clear_caches()
+
+
+def generate(settings=None, targets=None, start=None, end=None, workers=1, resume=False, force=False):
+    """
+    生成排放文件。输入、factor和输出的相对路径均相对于当前工作目录。
+
+    Args:
+        settings (str | dict | configparser.ConfigParser): 配置，为None时沿用已加载的配置。
+        targets (list): 输出目标，Target或 writer[:model] 形式的字符串；为None时为使用配置中model的CMAQ输出。
+        start (str): 起始日期，%Y-%m-%d，为None时使用配置中的start_date。
+        end (str): 结束日期，%Y-%m-%d，为None时使用配置中的end_date。
+        workers (int): 进程数。
+        resume (bool): 从各目标最后完成的文件之后继续。
+        force (bool): 忽略manifest，重新生成全部文件。
+
+    Returns:
+        list: 输出文件路径。
+
+    """
+    if settings is not None:
+        configure(settings)
+    if targets is None:
+        targets = [Target('cmaq', config.get('base', 'model'))]
+    targets = [parse_target(target) if isinstance(target, str) else target for target in targets]
+    start = start or config.get('time', 'start_date')
+    end = end or config.get('time', 'end_date')
+    return run(targets, start, end, workers, resume, force)
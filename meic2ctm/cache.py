@@ -0,0 +1,223 @@
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+import numpy as np
+
+from .config import config
+from .domain import domain_name
+
+
+def cache_dir(*parts):
+    """
+    返回磁盘缓存目录，不存在时自动创建。
+
+    Args:
+        *parts: 缓存根目录下的子目录名。
+
+    Returns:
+        str: 缓存目录路径。
+
+    """
+    path = os.path.join(config.get('base', 'cache_path', fallback='cache'), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_key(*parts):
+    """
+    根据参数生成稳定的缓存键，参数需可通过repr稳定表示。
+
+    Returns:
+        str: 16位十六进制摘要。
+
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def file_signature(path):
+    """
+    文件签名（路径、修改时间、大小），用于判断缓存是否失效。
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def projection_signature():
+    """
+    投影配置签名，作为网格相关缓存的键。
+    """
+    return (config.get('projection', 'lambert_params'),
+            config.getfloat('projection', 'xorig'),
+            config.getfloat('projection', 'yorig'),
+            config.getint('projection', 'dx'),
+            config.getint('projection', 'dy'),
+            config.getint('projection', 'xcells'),
+            config.getint('projection', 'ycells'))
+
+
+def save_array(path, array):
+    """
+    原子地保存npy文件，避免并发读取到写了一半的缓存。
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def sizeof(value):
+    """
+    估算缓存值占用的字节数，支持数组及由数组组成的元组。
+    """
+    if isinstance(value, np.memmap):
+        # 内存映射数组的数据位于磁盘，不计入缓存容量
+        return 0
+    if isinstance(value, np.ma.MaskedArray):
+        return value.data.nbytes + np.ma.getmaskarray(value).nbytes
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(sizeof(v) for v in value)
+    return 0
+
+
+class ArrayCache:
+    """
+    按字节数限制容量的LRU数组缓存。每个条目记录所属月份，运行进入新的月份后可整体释放旧月份的条目。
+    可被预读线程与主线程同时使用，加载函数在锁外执行。
+    """
+
+    def __init__(self, max_bytes):
+        self.lock = threading.RLock()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, month, loader):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        value = loader()
+        self.put(key, month, value)
+        return value
+
+    def put(self, key, month, value):
+        size = sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.evict(key)
+            if size > self.max_bytes:
+                return
+            while self.nbytes + size > self.max_bytes:
+                self.evict(next(iter(self.entries)))
+            self.entries[key] = (value, size, month)
+            self.nbytes += size
+
+    def evict(self, key):
+        with self.lock:
+            _, size, _ = self.entries.pop(key)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def release_months(self, months):
+        """
+        释放不属于给定月份的条目。
+
+        Args:
+            months (set): 仍需保留的月份（1-12）。
+
+        """
+        with self.lock:
+            for key in [key for key, (_, _, month) in self.entries.items() if month not in months]:
+                self.evict(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return (f'array cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), '
+                f'{self.evictions} evictions, {self.nbytes / 2 ** 20:.1f}/{self.max_bytes / 2 ** 20:.0f} MB in use')
+
+
+array_cache = ArrayCache(config.getint('base', 'cache_max_mb', fallback=4096) * 2 ** 20)
+
+
+def cached_array(month_arg, per_domain=True):
+    """
+    将函数返回的数组缓存到array_cache，所有参数需为可哈希的位置参数。
+
+    Args:
+        month_arg (int): 月份参数的位置，用于按月份释放缓存。
+        per_domain (bool): 结果是否与模拟网格有关，为True时键中包含当前模拟域名，各模拟域分别缓存。
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            key = (func.__module__, func.__name__, *args, domain_name()) if per_domain else \
+                (func.__module__, func.__name__, *args)
+            return array_cache.get(key, args[month_arg], lambda: func(*args))
+        return wrapper
+    return decorator
+
+
+def domain_cache(maxsize):
+    """
+    同lru_cache，但键中包含当前模拟域名，用于结果与模拟网格有关的函数，切换模拟域后不会命中其他模拟域的结果。
+    """
+    def decorator(func):
+        cached = lru_cache(maxsize=maxsize)(lambda domain, *args: func(*args))
+
+        @wraps(func)
+        def wrapper(*args):
+            return cached(domain_name(), *args)
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
+
+
+def lru_caches():
+    """
+    meic2ctm各模块中由lru_cache装饰的函数。
+
+    Returns:
+        dict: 函数全名到函数的映射。
+
+    """
+    caches = {}
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith('meic2ctm'):
+            continue
+        for value in vars(module).values():
+            if callable(value) and hasattr(value, 'cache_info') and getattr(value, '__module__', None) == module_name:
+                caches[f'{module_name}.{value.__name__}'] = value
+    return caches
+
+
+def clear_caches():
+    """
+    清空进程内的全部缓存（各lru_cache和array_cache），配置改变后调用。磁盘缓存以配置签名为键，无需清理。
+    """
+    for func in lru_caches().values():
+        func.cache_clear()
+    array_cache.clear()
@@ -0,0 +1,196 @@
+import os
+import datetime
+
+import numpy as np
+import netCDF4 as nc
+
+from .config import config
+from .domain import domain_name
+from .factor import load_species_unit
+from .lazy import lazy_enabled, store_blocks
+from .meic import load_speciation_matrix
+from .output import create_output, output_file, netcdf_lock, tagged_sectors, variable_options
+from .profiling import profiler
+from .temporal import iter_species_blocks
+
+
+def first_time(day):
+    # 每天的文件从first_hour开始
+    return day + datetime.timedelta(hours=config.getint('time', 'first_hour'))
+
+
+def file_times(ts):
+    return [ts + datetime.timedelta(hours=hour) for hour in range(0, config.getint('time', 'one_file_hours'))]
+
+
+def file_name(ts, sector=None):
+    name = ts.strftime(f'EM_China_{domain_name()}_%Y%m%d') + ".nc"
+    return name if sector is None else os.path.join(sector, name)
+
+
+def output_files(ts):
+    return [file_name(ts, sector) for sector in [None, *tagged_sectors()]]
+
+
+def expected_times(ts):
+    """
+    从ts开始的各输出文件应包含的时次。
+
+    Returns:
+        dict: 文件名到 [datetime] 的映射。
+
+    """
+    return {name: file_times(ts) for name in output_files(ts)}
+
+
+def read_times(path):
+    """
+    由TFLAG读取文件中的时次，各变量的TFLAG不一致时返回None。
+    """
+    with nc.Dataset(path) as ncfile:
+        tflag = ncfile.variables['TFLAG'][:]
+    if not (tflag == tflag[:, :1, :]).all():
+        return None
+    return [datetime.datetime.strptime(f'{date:07d}{time:06d}', '%Y%j%H%M%S') for date, time in tflag[:, 0, :]]
+
+
+def create_file(ts, model_specs, species_unit, sector=None):
+    import pyproj
+
+    ncfile = create_output(output_file(file_name(ts, sector)))
+
+    ncfile.createDimension('TSTEP', None)
+
+    # 创建 LAY、ROW、COL 维度
+    layers = config.get('projection', 'layers').split(',')
+    ncfile.createDimension('LAY', len(layers) - 1)
+    ncfile.createDimension('ROW', config.getint('projection', 'ycells'))
+    ncfile.createDimension('COL', config.getint('projection', 'xcells'))
+    ncfile.createDimension('VAR', len(model_specs))
+    ncfile.createDimension('DATE-TIME', 2)
+
+    ncfile.setncattr('FILEDESC', 'Emission aconc generated by meic')
+    ncfile.setncattr("GDTYP", "3");
+    lambert_params = config.get('projection', 'lambert_params')
+    proj = pyproj.Proj(lambert_params)
+    # 获取投影参数的具体数值
+    P_ALP = proj.srs.split('+lat_1=')[1].split(' ')[0]
+    P_BET = proj.srs.split('+lat_2=')[1].split(' ')[0]
+    P_GAM = proj.srs.split('+lon_0=')[1].split(' ')[0]
+    XCENT = proj.srs.split('+lon_0=')[1].split(' ')[0]
+    YCENT = proj.srs.split('+lat_0=')[1].split(' ')[0]
+
+    # 设置 NetCDF 文件的投影属性
+    ncfile.setncattr("P_ALP", float(P_ALP))
+    ncfile.setncattr("P_BET", float(P_BET))
+    ncfile.setncattr("P_GAM", float(P_GAM))
+    ncfile.setncattr("XCENT", float(XCENT))
+    ncfile.setncattr("YCENT", float(YCENT))
+
+    ncfile.setncattr("XORIG", config.getfloat('projection', 'xorig'));
+    ncfile.setncattr("YORIG", config.getfloat('projection', 'yorig'));
+    ncfile.setncattr("XCELL", config.getfloat('projection', 'dx'));
+    ncfile.setncattr("YCELL", config.getfloat('projection', 'dy'));
+
+    vglvs_array = np.array([float(x.replace('f', '')) for x in config.get('projection', 'layers').split(',')],
+                           dtype=np.float32)
+
+    ncfile.setncattr("VGLVLS", vglvs_array);
+
+    formatted_strings = [x.ljust(16) for x in model_specs]
+    var_list = ''.join(formatted_strings)
+    ncfile.setncattr("VAR-LIST", var_list);
+    ncfile.setncattr("FILEDESC", "Emission aconc generated by meic");
+    ncfile.setncattr("HISTORY", "");
+    ncfile.setncattr("FTYPE", int(1));
+    ncfile.setncattr("TSTEP", int(10000));
+    ncfile.setncattr("NTHIK", int(1));
+    ncfile.setncattr("VGTYP", int(7));
+    ncfile.setncattr("VGTOP", int(10000));
+    ncfile.setncattr("GDTYP", int(-9999));
+    ncfile.setncattr("GDNAM", "MEIC2");
+    ncfile.setncattr("UPNAM", "MEIC2");
+
+    ncfile.setncattr("EXEC_ID", "__EP_CMAQ__");
+
+    ncfile.setncattr("CDATE", int(datetime.datetime.now().strftime('%Y%j')));
+    ncfile.setncattr("CTIME", 0);
+    ncfile.setncattr("WDATE", int(datetime.datetime.now().strftime('%Y%j')));
+    ncfile.setncattr("WTIME", 0);
+    ncfile.setncattr("SDATE", int(ts.strftime('%Y%j')));
+    ncfile.setncattr("STIME", int(ts.hour * 10000));
+
+    ncfile.setncattr("NCOLS", config.getint('projection', 'xcells'));
+    ncfile.setncattr("NROWS", config.getint('projection', 'ycells'));
+    ncfile.setncattr("NLAYS", len(layers) - 1);
+
+    var = ncfile.createVariable('TFLAG', 'i', ('TSTEP', 'VAR', 'DATE-TIME'))
+    var.setncattr('units', '<YYYYDDD,HHMMSS>')
+    var.setncattr('long_name', 'TFLAG'.ljust(16))
+    var.setncattr('var_desc', "Timestep-valid flags: (1) YYYYDDD or (2) HHMMSS".ljust(80))
+
+    # 创建新的变量，并指定维度
+    for spec in model_specs:
+        var = ncfile.createVariable(spec, 'f4', ('TSTEP', 'LAY', 'ROW', 'COL'),
+                                    **variable_options((1, len(layers) - 1, config.getint('projection', 'ycells'),
+                                                        config.getint('projection', 'xcells'))))
+        var.setncattr('units', species_unit[spec].ljust(16))
+        var.setncattr('long_name', spec.ljust(16))
+        var.setncattr('var_desc', ("Model species " + spec).ljust(80))
+
+    ncfile.setncattr("NVARS", len(model_specs));
+
+    return ncfile
+
+
+def write_day(ts, basedir, carry=None):
+    """
+    写出从ts开始的一个CMAQ排放文件，tag_sectors = true 时同时写出各部门的文件。
+
+    Args:
+        ts (datetime): 文件起始时刻。
+        basedir (str): 模型名称，对应factor下的目录。
+        carry (OverlapCarry): 跨文件复用重叠时次的排放，为None时不复用。
+
+    """
+    print(f'calc date: {ts.year}-{ts.month}-{ts.day}')
+    write_file(ts, basedir, None, carry)
+    # 分部门文件与总量使用同一份月排放，不重复读取输入
+    for sector in tagged_sectors():
+        write_file(ts, basedir, sector)
+
+
+def write_file(ts, basedir, sector, carry=None):
+    model_specs = load_speciation_matrix(basedir)[0]
+    species_unit = load_species_unit(basedir)
+
+    # netCDF库非线程安全，与后台预读线程互斥访问
+    with netcdf_lock, profiler.stage('write_netcdf'):
+        ncfile = create_file(ts, model_specs, species_unit, sector)
+
+    # 文件内各时次，跨月时各时次使用所在月份的meic数据
+    times = file_times(ts)
+
+    tflag = np.array([[t.year * 1000 + t.timetuple().tm_yday, t.hour * 10000] for t in times])
+    with netcdf_lock, profiler.stage('write_netcdf'):
+        var = ncfile.variables['TFLAG']
+        var[0:len(times), :, :] = np.repeat(tflag[:, np.newaxis, :], len(model_specs), axis=1)
+
+    if carry is None:
+        blocks = iter_species_blocks(times, model_specs, basedir, sector)
+    else:
+        # 与上一天文件重叠的时次直接复用，末尾与下一天重叠的时次保留
+        blocks = carry.iter_species_blocks(times, model_specs, basedir, ts + datetime.timedelta(days=1))
+
+    for spec, block in blocks:
+        if lazy_enabled():
+            # 逐块计算并写出，不生成完整的block
+            with profiler.stage('write_netcdf'):
+                store_blocks([block], [ncfile.variables[spec]], [(slice(0, len(times)),)], netcdf_lock)
+            continue
+        with netcdf_lock, profiler.stage('write_netcdf'):
+            var = ncfile.variables[spec]
+            var[0:len(times), :, :, :] = block
+
+    with netcdf_lock, profiler.stage('write_netcdf'):
+        ncfile.close()
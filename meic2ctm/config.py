@@ -1,5 +1,30 @@
-import configparser 
+import configparser
 
 
+# 全局配置，由load_config加载，导入时不读取任何文件
 config = configparser.ConfigParser()
-config.read('config.ini')
\ No newline at end of file
+
+
+def load_config(source='config.ini'):
+    """
+    加载配置，替换全局config的全部内容。各模块在调用时读取config，加载后立即生效。
+
+    Args:
+        source (str | dict | configparser.ConfigParser): 配置文件路径、{section: {option: value}} 形式的字典
+            或已有的ConfigParser。
+
+    Returns:
+        configparser.ConfigParser: 全局config。
+
+    """
+    parser = configparser.ConfigParser()
+    if isinstance(source, (dict, configparser.ConfigParser)):
+        parser.read_dict(source)
+    else:
+        with open(source, encoding='utf-8') as f:
+            parser.read_file(f)
+
+    config.clear()
+    config.defaults().clear()
+    config.read_dict({section: dict(parser.items(section, raw=True)) for section in parser.sections()})
+    return config
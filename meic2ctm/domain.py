@@ -0,0 +1,75 @@
+import os
+from contextlib import contextmanager
+
+from .config import config
+
+# 嵌套域的配置节前缀，如 [projection.d02]；[projection] 为母域
+section_prefix = 'projection.'
+
+# use_domain切换前 [projection] 的原始内容，未切换时为None
+base_projection = None
+
+
+def domain_name():
+    """
+    当前模拟域的名称，用于输出文件名和缓存键。母域由 [projection] 的domain配置，默认为d01。
+    """
+    return config.get('projection', 'domain', fallback='d01')
+
+
+def base_domain():
+    section = base_projection if base_projection is not None else dict(config.items('projection', raw=True))
+    return section.get('domain', 'd01')
+
+
+def domain_names():
+    """
+    配置中的全部模拟域，母域在前，嵌套域按配置节的顺序排列。
+
+    Returns:
+        list: 模拟域名称。
+
+    """
+    return [base_domain(), *[section[len(section_prefix):] for section in config.sections()
+                             if section.startswith(section_prefix)]]
+
+
+@contextmanager
+def use_domain(name):
+    """
+    在with块内以name模拟域的配置替换 [projection]，退出时恢复。嵌套域配置节中未给出的配置项
+    （lambert_params、layers、regrid等）沿用母域。
+
+    切换会修改全局配置，只应在主线程中、没有预读线程运行时调用。
+
+    Args:
+        name (str): 模拟域名称，见domain_names。
+
+    """
+    global base_projection
+
+    if name == domain_name():
+        yield
+        return
+    base = base_projection if base_projection is not None else dict(config.items('projection', raw=True))
+    values = dict(base)
+    if name != base.get('domain', 'd01'):
+        values.update(config.items(section_prefix + name, raw=True))
+        values['domain'] = name
+
+    previous, previous_base = dict(config.items('projection', raw=True)), base_projection
+    base_projection = base
+    config['projection'] = values
+    try:
+        yield
+    finally:
+        config['projection'] = previous
+        base_projection = previous_base
+
+
+def meic_path(year):
+    """
+    当前模拟域某年MEIC asc文件所在目录。MEIC数据需按各模拟域的网格分别下载，
+    目录由 [projection] 或嵌套域配置节的meic_path配置，默认为input/MEIC。
+    """
+    return os.path.join(config.get('projection', 'meic_path', fallback='./input/MEIC'), str(year))
@@ -0,0 +1,91 @@
+import os
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from . import meic
+from .cache import array_cache
+from .config import config
+from .domain import domain_names, use_domain
+from .factor import load_pm_species
+from .mix import close_mix
+from .profiling import profiler
+from .runner import run, target_months
+
+
+def scenario_name(control_file_path):
+    # 以调控系数文件名作为情景名及输出子目录名
+    return os.path.splitext(os.path.basename(control_file_path))[0]
+
+
+def warm_baseline(months):
+    """
+    在主进程中计算未调控的基准排放：MIX投影结果和MEIC排放，与模型机制和调控方案无关。
+    工作进程通过fork继承这些缓存，各情景只需乘以调控系数网格后再做物种分配。
+
+    Args:
+        months (list): [(year, month, basedir)]。
+
+    """
+    sectors = config.get('base', 'sectors').split(',')
+    for year, month, basedir in months:
+        _, meic_specs, _ = meic.load_speciation_matrix(basedir)
+        pm_species = load_pm_species(basedir)
+        specs = {'PM25' if spec in pm_species else spec for spec in meic_specs}
+        for sector in sectors:
+            for spec in sorted(specs):
+                meic.load_projected_mix(year, month, sector, spec)
+                meic.load_asc(year, month, sector, spec, None)
+
+
+def run_scenario(control_file_path, output_path, targets, start, end, resume, force):
+    config.set('inventory', 'control_file', control_file_path)
+    config.set('base', 'output_path', output_path)
+    os.makedirs(output_path, exist_ok=True)
+    profiler.reset()
+    run(targets, start, end, 1, resume, force)
+    return profiler.snapshot()
+
+
+def run_ensemble(control_files, targets, start, end, workers=1, resume=False, force=False):
+    """
+    对同一基准排放应用多个调控方案，每个方案输出到 output_path/情景名 目录。
+    按月在主进程中计算一次基准排放，各方案在进程池中并行写出。
+
+    Args:
+        control_files (list): 调控系数文件。
+        targets (list): [Target]。
+        start (str): 起始日期，%Y-%m-%d。
+        end (str): 结束日期，%Y-%m-%d。
+        workers (int): 同时运行的情景数。
+
+    """
+    names = [scenario_name(path) for path in control_files]
+    if len(set(names)) != len(names):
+        raise ValueError('control files must have distinct names')
+    output_root = config.get('base', 'output_path', fallback='output')
+
+    day = datetime.datetime.strptime(start, '%Y-%m-%d')
+    te = datetime.datetime.strptime(end, '%Y-%m-%d')
+    chunks = {}
+    while day <= te:
+        chunks.setdefault((day.year, day.month), []).append(day)
+        day += datetime.timedelta(days=1)
+
+    context = multiprocessing.get_context('fork')
+    for days in chunks.values():
+        months = sorted({key for day in days for target in targets for key in target_months(target, day)})
+        array_cache.release_months({month for _, month, _ in months})
+        for name in domain_names():
+            with use_domain(name):
+                warm_baseline(months)
+        # MIX文件句柄不能跨进程共享，fork前关闭
+        close_mix()
+
+        chunk_start, chunk_end = days[0].strftime('%Y-%m-%d'), days[-1].strftime('%Y-%m-%d')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(run_scenario, path, os.path.join(output_root, name), targets,
+                                   chunk_start, chunk_end, resume, force)
+                       for path, name in zip(control_files, names)]
+            for future in futures:
+                profiler.merge(future.result())
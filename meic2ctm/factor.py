@@ -3,10 +3,11 @@ import calendar
 import pandas as pd
 from functools import lru_cache
 import numpy as np
-import geopandas as gpd
-from shapely.geometry import Point
 
-from meic2ctm import projection
+from .cache import cached_array
+from .config import config
+from .geo import load_province_grid
+from .profiling import profiler
 
 
 @lru_cache(maxsize=10)
@@ -103,23 +104,67 @@ def get_hour_factor(hour, sector):
     return re[0]['hour_factor']
 
 
+@lru_cache(maxsize=4)
+def load_temporal_profiles():
+    """
+    加载日分配和小时分配系数表。
+
+    Returns:
+        tuple: (day, hour) 两个以sector为索引的DataFrame，列分别为周一至周日（1-7）和0-23时。
+
+    """
+    day = pd.read_csv('./factor/day.csv', index_col='sector')
+    hour = pd.read_csv('./factor/hour.csv', index_col='sector')
+    return day[[str(i) for i in range(1, 8)]], hour[[str(i) for i in range(24)]]
+
+
+def calc_time_factors(sectors, times):
+    """
+    一次性计算各部门在各时刻的时间分配系数（日系数 × 小时系数）。
+    日系数按所在月份内全部日期的系数之和归一化，与get_day_factor一致。
+
+    Args:
+        sectors (list): 部门名称。
+        times (list): datetime时刻。
+
+    Returns:
+        np.ndarray: (len(sectors), len(times)) 的系数表。
+
+    """
+    day, hour = load_temporal_profiles()
+    day_weights = day.loc[list(sectors)].to_numpy(dtype=float)
+    hour_weights = hour.loc[list(sectors)].to_numpy(dtype=float)
+
+    weekdays = np.array([t.weekday() for t in times])
+    hours = np.array([t.hour for t in times])
+    months = np.array([t.year * 100 + t.month for t in times])
+
+    # 每个时刻所在月份的日系数之和
+    month_sum = np.empty((len(sectors), len(times)))
+    for year_month in np.unique(months):
+        year, month = divmod(int(year_month), 100)
+        first_weekday, month_days = calendar.monthrange(year, month)
+        weekday_counts = np.bincount((first_weekday + np.arange(month_days)) % 7, minlength=7)
+        month_sum[:, months == year_month] = (day_weights @ weekday_counts).reshape(-1, 1)
+
+    return day_weights[:, weekdays] / month_sum * hour_weights[:, hours]
+
+
 @lru_cache(maxsize=10)
-def load_species_convert():
+def load_species_convert(basedir):
     '''
         加载物种转换系数
     '''
-    df = pd.read_csv('./factor/species-convert.csv')  # 假设CSV文件中没有列名
+    df = pd.read_csv(f'./factor/{basedir}/species-convert.csv')
     # 将数据转换成键-值形式的map
     model_species_map = dict(zip(df['species'], df['unit_convert']))
     return model_species_map
 
 
-lru_cache(maxsize=10)
-
-
-def load_layer_weight(sector):
-    df = pd.read_csv('./factor/layer.csv')  # 假设CSV文件中没有列名
-    coefficients = df[df['sector'] == sector].iloc[0, 1:].values
+@lru_cache(maxsize=64)
+def load_layer_weight(basedir, sector):
+    df = pd.read_csv(f'./factor/{basedir}/layer.csv')
+    coefficients = df[df['sector'] == sector].iloc[0, 1:].values.astype(np.float32)
     return coefficients
 
 
@@ -134,37 +179,69 @@ def load_pm_factor(basedir, sector, parameter):
     return coefficient
 
 
-@lru_cache(maxsize=128)
+@lru_cache(maxsize=10)
+def load_pm_species(basedir):
+    """
+    由PM2.5按比例拆分得到的PM组分，即pm25factor.csv中除部门外的各列。
+
+    Args:
+        basedir (str): 模型名称，对应factor下的目录。
+
+    Returns:
+        list: PM组分名称。
+
+    """
+    df = pd.read_csv(f"./factor/{basedir}/pm25factor.csv")
+    return [column for column in df.columns if column != 'Sector']
+
+
+@lru_cache(maxsize=10)
+def load_species_unit(basedir):
+    """
+    加载模型物种的单位。
+
+    Returns:
+        dict: 模型物种到单位的映射。
+
+    """
+    df = pd.read_csv(f"./factor/{basedir}/species-unit.csv")
+    return dict(zip(df['var'], df['units']))
+
+
+def control_file():
+    """
+    配置的调控系数文件，未配置时返回None。
+    """
+    if config.has_option('inventory', 'control_file'):
+        return config.get('inventory', 'control_file')
+    return None
+
+
+@lru_cache(maxsize=4)
+def load_control_table(control_file_path):
+    return pd.read_csv(control_file_path)
+
+
+@cached_array(month_arg=3)
+@profiler.timed('load_control_factor')
 def load_control_factor(control_file_path, sector, year, month, species):
-    df = pd.read_csv(control_file_path)
+    """
+    生成调控系数网格，未配置调控的省份和域外网格系数为1。
+
+    Returns:
+        np.ndarray | None: (ycells, xcells) 的系数网格，行序与MEIC asc文件一致（由北向南）；无匹配记录时返回None。
+
+    """
+    df = load_control_table(control_file_path)
     filtered_df = df[(df['sector'] == sector) &
                      (df['year'] == year) &
                      (df['month'] == month) &
                      (df['species'] == species)]
     if filtered_df.empty:
         return None
-    else:
-        grid = np.ones((projection.idy, projection.idx))
-        for i in range(projection.idx):
-            for j in range(projection.idy):
-                lat = projection.dest_lat[i][j]
-                lon = projection.dest_lon[i][j]
-                adcode = get_province_from_shapefile(lon, lat)
-                if adcode is not None:
-                    for index, row in filtered_df.iterrows():
-                        if row['adcode'] == adcode:
-                            grid[j, i] = row['factor']
-        grid = np.flipud(grid)
-        return grid
-
-
-gdf = gpd.read_file("factor/shp/province.shp")
-
-
-@lru_cache(maxsize=36000)
-def get_province_from_shapefile(lon, lat):
-    point = Point(lon, lat)
-    for _, row in gdf.iterrows():
-        if row['geometry'].contains(point):
-            return int(row['pr_adcode'][:2])
-    return None
+
+    province_grid = load_province_grid()
+    adcodes = filtered_df['adcode'].to_numpy(dtype=int)
+    lookup = np.ones(max(adcodes.max(), province_grid.max()) + 1)
+    lookup[adcodes] = filtered_df['factor'].to_numpy(dtype=float)
+    return np.flipud(lookup[province_grid])
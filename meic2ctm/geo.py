@@ -1,6 +1,12 @@
+import os
 import numpy as np
 from functools import lru_cache
 
+from .cache import cache_dir, cache_key, domain_cache, file_signature, projection_signature, save_array
+
+province_shapefile = 'factor/shp/province.shp'
+
+
 def calc_area(lat):
     Re = 6371.392
     X = Re * np.cos(lat * (np.pi / 180)) * (np.pi / 180) * 0.25
@@ -13,3 +19,60 @@ def calc_area_all():
     latitudes = np.arange(-20.25, 90, 0.25)
     area_array = calc_area(latitudes)
     return area_array
+
+
+@lru_cache(maxsize=1)
+def load_province_shapes():
+    import geopandas as gpd
+
+    return gpd.read_file(province_shapefile)
+
+
+def rasterize_province(lon, lat):
+    """
+    计算每个点所在省份的2位行政区划代码。
+
+    Args:
+        lon (np.ndarray): 经度。
+        lat (np.ndarray): 纬度，与lon形状一致。
+
+    Returns:
+        np.ndarray: 与lon形状一致的int16数组，不在任何省份内的点为0。
+
+    """
+    import shapely
+
+    gdf = load_province_shapes()
+    codes = gdf['pr_adcode'].str[:2].astype(int).to_numpy()
+
+    points = shapely.points(np.ravel(lon), np.ravel(lat))
+    tree = shapely.STRtree(gdf.geometry.values)
+    point_idx, shape_idx = tree.query(points, predicate='within')
+
+    # 点落在多个面内时取shapefile中靠前的省份
+    order = np.argsort(shape_idx, kind='stable')[::-1]
+    grid = np.zeros(points.shape, dtype=np.int16)
+    grid[point_idx[order]] = codes[shape_idx[order]]
+    return grid.reshape(np.shape(lon))
+
+
+@domain_cache(maxsize=4)
+def load_province_grid():
+    """
+    加载模拟域的省份栅格，按投影配置和shapefile缓存到磁盘。
+
+    Returns:
+        np.ndarray: (ycells, xcells) 的int16数组，行序由南向北。
+
+    """
+    from . import projection
+
+    key = cache_key(projection_signature(), file_signature(province_shapefile))
+    path = os.path.join(cache_dir('province'), f'{key}.npy')
+    if os.path.exists(path):
+        return np.load(path)
+
+    grid = projection.projection_base('1')
+    province_grid = rasterize_province(grid.lon.T, grid.lat.T)
+    save_array(path, province_grid)
+    return province_grid
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import config
+
+# 各进程的计算线程池。fork出的工作进程不能使用父进程的线程池，按进程号分别创建
+thread_pools = {}
+
+
+def lazy_enabled():
+    """
+    是否启用分块计算模式。启用后物种分配和时间、垂直分配按行分块由dask多线程计算，
+    月排放保存在磁盘上的内存映射文件中，逐块写出，峰值内存与分块大小而非模拟域大小相关。
+    """
+    return config.getboolean('base', 'lazy', fallback=False)
+
+
+def tile_rows():
+    # 每个分块的网格行数
+    return config.getint('base', 'tile_rows', fallback=128)
+
+
+def thread_pool():
+    pid = os.getpid()
+    if pid not in thread_pools:
+        max_workers = config.getint('base', 'lazy_threads', fallback=os.cpu_count())
+        thread_pools[pid] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tile')
+    return thread_pools[pid]
+
+
+def store_blocks(sources, targets, regions=None, lock=False):
+    """
+    使用本进程的线程池逐块计算dask数组并写入目标数组或netCDF变量。
+    lock为netcdf_lock时各线程写出时持有该锁，此时调用方不能持有netcdf_lock。
+
+    Args:
+        sources (list): dask数组。
+        targets (list): 目标数组或netCDF变量。
+        regions (list): 各数组在目标中的写出位置，为切片组成的元组；为None时写入整个目标。
+        lock: 写出时持有的锁，False表示不加锁。
+
+    """
+    import dask.array as da
+
+    da.store(sources, targets, regions=regions, lock=lock, scheduler='threads', pool=thread_pool())
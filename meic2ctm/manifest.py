@@ -0,0 +1,144 @@
+import os
+import glob
+import json
+import fcntl
+import hashlib
+import datetime
+from functools import lru_cache
+
+from .cache import cache_key, file_signature
+from .config import config
+from .domain import meic_path, section_prefix
+from .factor import control_file
+from .output import output_file
+
+# 不影响输出文件内容的配置项
+ignored_options = {
+    ('base', 'model'),
+    ('base', 'cache_path'),
+    ('base', 'cache_max_mb'),
+    ('time', 'start_date'),
+    ('time', 'end_date'),
+    ('time', 'prefetch_days'),
+}
+
+
+def config_signature():
+    # 嵌套域的配置节只影响该模拟域的输出，写出时已替换到 [projection] 中
+    return sorted((section, option, value)
+                  for section in config.sections()
+                  for option, value in config.items(section)
+                  if (section, option) not in ignored_options and not section.startswith(section_prefix))
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=16)
+def factor_signature(basedir):
+    # 分配系数表按内容计算签名，修改后即使时间戳不变也能识别
+    paths = ['./factor/day.csv', './factor/hour.csv', *sorted(glob.glob(f'./factor/{basedir}/*.csv'))]
+    return tuple((path, file_digest(path)) for path in paths)
+
+
+@lru_cache(maxsize=64)
+def month_input_signature(path, year, month):
+    asc_files = sorted(glob.glob(os.path.join(path, f'{year}_{str(month).zfill(2)}_*.asc')))
+    return tuple(file_signature(asc_file) for asc_file in asc_files)
+
+
+@lru_cache(maxsize=16)
+def common_input_signature(control_file_path):
+    # MIX清单、掩膜和调控相关的文件，与输出日期无关
+    mix_year = config.get('inventory', 'mix_inventory_year')
+    if config.get('inventory', 'mix_inventory_version') == '1':
+        paths = sorted(glob.glob(f'./input/MIX/MIX_V1/MIX_{mix_year}/*.nc')) + ['./factor/mask_china.csv']
+    else:
+        paths = sorted(glob.glob(f'./input/MIX/MIX_V2/{mix_year}/*.nc')) + ['./factor/mask_mix_v2_china.csv']
+    if control_file_path is not None:
+        paths.append(control_file_path)
+        paths.extend(sorted(glob.glob('./factor/shp/province.*')))
+    return tuple(file_signature(path) for path in paths if os.path.exists(path))
+
+
+def output_signature(writer, basedir, months):
+    """
+    某输出文件所依赖的配置、分配系数表和输入文件的签名。
+
+    Args:
+        writer (str): 输出格式。
+        basedir (str): 模型名称，对应factor下的目录。
+        months (list): 文件所需的 [(year, month)]。
+
+    Returns:
+        str: 签名摘要。
+
+    """
+    return cache_key(writer, basedir, config_signature(), factor_signature(basedir),
+                     common_input_signature(control_file()),
+                     [month_input_signature(meic_path(year), year, month) for year, month in months])
+
+
+class Manifest:
+    """
+    输出目录下的manifest.json，记录每个已完成的输出文件及其依赖签名。
+    重新运行时跳过签名一致的文件，只重新生成过期或缺失的文件。
+    多个进程（如分片运行的多个作业）可共用同一输出目录：保存时在文件锁内重新读取磁盘上的记录，
+    只合并本进程的修改。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or output_file('manifest.json')
+        self.entries = self.load()
+        self.updated = {}
+        self.removed = set()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                return json.load(f)
+        return {}
+
+    def is_current(self, files, signature):
+        return all(self.entries.get(name, {}).get('signature') == signature and os.path.exists(output_file(name))
+                   for name in files)
+
+    def last_completed(self, target):
+        """
+        某输出目标最后完成的文件的起始时刻，无记录时返回None。
+        """
+        times = [entry['time'] for entry in self.entries.values() if entry['target'] == target]
+        return datetime.datetime.fromisoformat(max(times)) if times else None
+
+    def discard(self, files):
+        # 重新生成前先移除记录，写出中断时文件不会被误认为已完成
+        for name in files:
+            self.updated.pop(name, None)
+            self.removed.add(name)
+        self.save()
+
+    def record(self, files, target, ts, signature):
+        completed = datetime.datetime.now().isoformat(timespec='seconds')
+        for name in files:
+            self.removed.discard(name)
+            self.updated[name] = {'target': target, 'time': ts.isoformat(), 'signature': signature,
+                                  'completed': completed}
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f'{self.path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self.load()
+            for name in self.removed:
+                entries.pop(name, None)
+            entries.update(self.updated)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        self.entries = entries
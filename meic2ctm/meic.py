@@ -1,59 +1,73 @@
 import os
+import threading
+from collections import namedtuple
 from functools import lru_cache
 import numpy as np
-import pandas as pd
 
+from .cache import cache_dir, cache_key, file_signature, save_array, cached_array
 from .config import config
-from .factor import load_species_map, load_pm_factor, load_control_factor
+from .domain import meic_path
+from .factor import load_species_map, load_species_convert, load_layer_weight, load_pm_factor, load_pm_species, \
+    load_control_factor, control_file
+from .lazy import lazy_enabled, store_blocks, tile_rows
 from .mix import load_mix
-from .projection import projection
-
-
-@lru_cache(maxsize=128)
-def load_asc(year, month, sector, meic_spec_name):
-    asc_file = './input/MEIC/{}/{}_{}_{}_{}.asc'.format(year, year, str(month).zfill(2), sector, meic_spec_name)
-
-    control_file_path = None
-    if config.has_option('inventory', 'control_file'):
-        control_file_path = config.get('inventory', 'control_file')
-
-    pm_factor = None
-    if 'PMcoarse' in asc_file:
-        pm10 = np.loadtxt(asc_file.replace('PMcoarse', 'PM10'), skiprows=6, dtype=np.float32)
-        if control_file_path is not None:
-            control_factor = load_control_factor(control_file_path, sector, year, month, 'PM10')
-            if control_factor is not None:
-                pm10 *= control_factor
-        pm25 = np.loadtxt(asc_file.replace('PMcoarse', 'PM25'), skiprows=6, dtype=np.float32)
-        if control_file_path is not None:
-            control_factor = load_control_factor(control_file_path, sector, year, month, 'PM25')
-            if control_factor is not None:
-                pm25 *= control_factor
-        dat = pm10 - pm25
-    elif not os.path.exists(asc_file):
-        parts = asc_file.split('_')
-        sector = parts[2]
-        species = parts[3].split('.')[0]
-        pm_factor = load_pm_factor(config.get('base', 'model'), sector, species)
-        asc_file = asc_file.replace(species, 'PM25')
-        dat = np.loadtxt(asc_file, skiprows=6, dtype=np.float32)
-        if control_file_path is not None:
-            control_factor = load_control_factor(control_file_path, sector, year, month, 'PM25')
-            if control_factor is not None:
-                dat *= control_factor
-    else:
-        dat = np.loadtxt(asc_file, skiprows=6, dtype=np.float32)
-        if control_file_path is not None:
-            if '_' in meic_spec_name:
-                control_factor = load_control_factor(control_file_path, sector, year, month, 'VOC')
-            else:
-                control_factor = load_control_factor(control_file_path, sector, year, month, meic_spec_name)
-            if control_factor is not None:
-                dat *= control_factor
-    dat = np.flipud(dat)
-    if pm_factor is not None:
-        dat *= pm_factor
-    return dat
+from .profiling import profiler
+from .projection import projection, mix_axes, mix_window
+
+# 某月的分部门地面排放及垂直廓线
+MonthEmission = namedtuple('MonthEmission', ['model_specs', 'sectors', 'surface', 'profiles'])
+
+
+def read_asc(asc_file):
+    """
+    读取MEIC asc网格。首次读取时转存为float32的npy缓存，之后以内存映射方式读取；
+    源文件修改时间或大小变化后缓存自动失效。
+
+    Args:
+        asc_file (str): asc文件路径。
+
+    Returns:
+        np.ndarray: 只读的 (nrows, ncols) 数组，行序与asc文件一致（由北向南）。
+
+    """
+    key = cache_key(file_signature(asc_file))
+    name = os.path.splitext(os.path.basename(asc_file))[0]
+    path = os.path.join(cache_dir('asc'), f'{name}.{key}.npy')
+    if not os.path.exists(path):
+        save_array(path, np.loadtxt(asc_file, skiprows=6, dtype=np.float32))
+    return np.load(path, mmap_mode='r')
+
+
+@cached_array(month_arg=1)
+@profiler.timed('load_asc', count_bytes=True)
+def load_asc(year, month, sector, meic_spec_name, control_file_path):
+    """
+    读取某部门某物种的MEIC排放并乘以调控系数。未调控的基准排放单独缓存，
+    不同调控方案只需在基准排放上乘以各自的系数网格。
+
+    Args:
+        control_file_path (str): 调控系数文件，为None时返回未调控的基准排放。
+
+    Returns:
+        np.ndarray: (ROW, COL) 的float32数组，行序由南向北。
+
+    """
+    if meic_spec_name == 'PMcoarse':
+        pm10 = load_asc(year, month, sector, 'PM10', control_file_path)
+        pm25 = load_asc(year, month, sector, 'PM25', control_file_path)
+        return pm10 - pm25
+
+    if control_file_path is None:
+        asc_file = os.path.join(meic_path(year), f'{year}_{str(month).zfill(2)}_{sector}_{meic_spec_name}.asc')
+        return np.flipud(np.array(read_asc(asc_file)))
+
+    # VOC各组分共用VOC的调控系数
+    control_species = 'VOC' if '_' in meic_spec_name else meic_spec_name
+    control_factor = load_control_factor(control_file_path, sector, year, month, control_species)
+    baseline = load_asc(year, month, sector, meic_spec_name, None)
+    if control_factor is None:
+        return baseline
+    return (baseline * np.flipud(control_factor)).astype(np.float32)
 
 
 def calc_area(lat, mix_version='1'):
@@ -64,57 +78,215 @@ def calc_area(lat, mix_version='1'):
     return X * Y
 
 
-@lru_cache(maxsize=128)
-def load_meic_dat_by_spec(year, month, spec):
-    df_sr = load_species_map(config.get('base', 'model'))
-    sectors = config.get('base', 'sectors').split(',')
+@lru_cache(maxsize=4)
+def load_speciation_matrix(basedir):
+    """
+    将species-map.csv整理为MEIC物种到模型物种的权重矩阵，并将单位转换系数并入其中。
+
+    Args:
+        basedir (str): 模型名称，对应factor下的目录。
+
+    Returns:
+        tuple: (model_specs, meic_specs, weights)，weights为 (len(model_specs), len(meic_specs)) 的矩阵。
+
+    """
+    df_sr = load_species_map(basedir)
+    unit_convert = load_species_convert(basedir)
+
+    model_specs = df_sr['model_spec'].drop_duplicates().to_list()
+    # 权重为0的MEIC物种不参与计算，无需读取
+    meic_specs = df_sr[df_sr.weight != 0]['meic_spec'].drop_duplicates().to_list()
+
+    weights = np.zeros((len(model_specs), len(meic_specs)))
+    for row in df_sr[df_sr.weight != 0].itertuples():
+        weights[model_specs.index(row.model_spec), meic_specs.index(row.meic_spec)] += \
+            row.weight * unit_convert[row.model_spec]
+    return model_specs, meic_specs, weights
+
+
+@cached_array(month_arg=1)
+def load_projected_mix(year, month, sector, meic_spec_name):
+    """
+    读取某部门某物种的MIX排放并投影到模拟网格。
+
+    Returns:
+        np.ndarray: (ROW, COL) 的float32数组。
+
+    """
     mix_year = config.get('inventory', 'mix_inventory_year')
     mix_ver = config.get('inventory', 'mix_inventory_version')
 
-    dfm = df_sr[df_sr.model_spec == spec]
-    dfms = dfm.to_dict(orient='records')
+    # MIX数据按网格面积换算为排放强度，MIX数据只读取覆盖模拟域的窗口
+    latitudes, _, _ = mix_axes(mix_ver)
+    rows, _ = mix_window(mix_ver)
+    area_array = np.expand_dims(calc_area(latitudes[rows], mix_ver), 1)
+
+    df_mix = np.ma.copy(load_mix(mix_year, month, sector, meic_spec_name, mix_ver))
+    df_mix /= area_array
+    return np.array(projection(df_mix, mix_ver), dtype=np.float32)
+
+
+@cached_array(month_arg=1)
+def load_projected(year, month, sector, meic_spec_name, control_file_path):
+    """
+    叠加投影后的MIX排放和调控后的MEIC排放。结果与模型机制无关，可在各模型间共享。
+
+    Returns:
+        np.ndarray: (ROW, COL) 的float32数组。
+
+    """
+    return load_projected_mix(year, month, sector, meic_spec_name) + \
+        load_asc(year, month, sector, meic_spec_name, control_file_path)
+
+
+def load_sector_field(year, month, sector, meic_spec_name, basedir, control_file_path):
+    """
+    某部门某MEIC物种投影到模拟网格后的排放，PM组分由PM2.5按该模型的部门比例拆分。
+
+    Returns:
+        np.ndarray: (ROW, COL) 的float32数组。
+
+    """
+    if meic_spec_name in load_pm_species(basedir):
+        projected_data = load_projected(year, month, sector, 'PM25', control_file_path)
+        return np.multiply(projected_data, load_pm_factor(basedir, sector, meic_spec_name), dtype=np.float32)
+    return load_projected(year, month, sector, meic_spec_name, control_file_path)
+
+
+def load_sector_species(year, month, sector, meic_specs, basedir, control_file_path):
+    """
+    读取某部门全部MEIC物种投影到模拟网格后的排放。
+
+    Args:
+        basedir (str): 模型名称，对应factor下的目录。
+        control_file_path (str): 调控系数文件，为None时不调控。
+
+    Returns:
+        np.ndarray: (len(meic_specs), ROW, COL) 的float32数组。
+
+    """
+    stack = None
+    for i, meic_spec_name in enumerate(meic_specs):
+        field = load_sector_field(year, month, sector, meic_spec_name, basedir, control_file_path)
+        if stack is None:
+            stack = np.empty((len(meic_specs), *field.shape), dtype=np.float32)
+        stack[i] = field
+    return stack
+
+
+# 主进程以内存映射方式共享给工作进程的月排放，键为 (year, month, basedir)
+shared_months = {}
+
+# 后台线程正在预读的月排放，键为 (year, month, basedir)，值为Future
+pending_months = {}
+
+
+def load_meic_month(year, month, basedir):
+    """
+    加载某月各部门全部模型物种的地面排放，优先使用主进程共享或后台预读的数据。
+
+    Returns:
+        MonthEmission: 见calc_meic_month。
+
+    """
+    key = (year, month, basedir)
+    if key in shared_months:
+        return shared_months[key]
+    # 预读尚未完成时等待其结果，避免重复计算
+    future = pending_months.pop(key, None)
+    if future is not None:
+        return future.result()
+    return calc_meic_month(year, month, basedir, control_file())
+
+
+@cached_array(month_arg=1)
+def calc_meic_month(year, month, basedir, control_file_path):
+    """
+    计算某月各部门全部模型物种的地面排放。每个部门的MEIC物种只读取、投影一次，
+    再通过一次矩阵乘法得到全部模型物种。垂直分配以廓线形式保存，写出时再展开。
+
+    Args:
+        basedir (str): 模型名称，对应factor下的目录。
+        control_file_path (str): 调控系数文件，为None时不调控。
+
+    Returns:
+        MonthEmission: surface为 (len(model_specs), len(sectors), ROW, COL) 的地面排放，
+        profiles为 (len(sectors), LAY) 的垂直分配系数。
+
+    """
+    if lazy_enabled():
+        return calc_meic_month_tiled(year, month, basedir, control_file_path)
+
+    model_specs, meic_specs, weights = load_speciation_matrix(basedir)
+    sectors = config.get('base', 'sectors').split(',')
+
+    surface = None
+    for sector_index, sector in enumerate(sectors):
+        stack = load_sector_species(year, month, sector, meic_specs, basedir, control_file_path)
+        if surface is None:
+            surface = np.empty((len(model_specs), len(sectors), *stack.shape[1:]), dtype=np.float32)
+        with profiler.stage('speciation'):
+            # 权重有正有负（如PM组分扣减），以双精度累加避免抵消误差
+            result = np.tensordot(weights, stack, axes=1)
+            result[result < 0] = 0
+            surface[:, sector_index] = result
+
+    profiles = np.stack([load_layer_weight(basedir, sector) for sector in sectors])
+    return MonthEmission(model_specs, sectors, surface, profiles)
+
+
+def calc_meic_month_tiled(year, month, basedir, control_file_path):
+    """
+    与calc_meic_month相同，但各物种的投影结果按行分块做物种分配，由dask多线程计算后
+    写入磁盘上的内存映射文件，地面排放不常驻内存。
+
+    Returns:
+        MonthEmission: surface为只读的内存映射数组。
+
+    """
+    import dask
+    import dask.array as da
+
+    model_specs, meic_specs, weights = load_speciation_matrix(basedir)
+    sectors = config.get('base', 'sectors').split(',')
+    shape = (config.getint('projection', 'ycells'), config.getint('projection', 'xcells'))
+
+    path = os.path.join(cache_dir('tiles'),
+                        f'{year}{str(month).zfill(2)}.{basedir}.{os.getpid()}.{threading.get_ident()}.npy')
+    surface = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                        shape=(len(model_specs), len(sectors), *shape))
+    for sector_index, sector in enumerate(sectors):
+        fields = [da.from_delayed(dask.delayed(load_sector_field)(year, month, sector, meic_spec_name, basedir,
+                                                                  control_file_path), shape, np.float32)
+                  for meic_spec_name in meic_specs]
+        stack = da.stack(fields).rechunk((-1, tile_rows(), -1))
+        # 权重有正有负（如PM组分扣减），以双精度累加避免抵消误差
+        result = da.maximum(da.tensordot(weights, stack, axes=1), 0).astype(np.float32)
+        # 分块计算包含各物种的读取和投影
+        with profiler.stage('speciation'):
+            store_blocks([result], [surface[:, sector_index]])
+    surface.flush()
+    del surface
+
+    # 映射建立后即删除文件，进程退出时由系统回收
+    surface = np.load(path, mmap_mode='r')
+    os.remove(path)
+
+    profiles = np.stack([load_layer_weight(basedir, sector) for sector in sectors])
+    return MonthEmission(model_specs, sectors, surface, profiles)
+
+
+def load_meic_dat_by_spec(year, month, spec, basedir=None):
+    if basedir is None:
+        basedir = config.get('base', 'model')
+    month_data = load_meic_month(year, month, basedir)
+    spec_index = month_data.model_specs.index(spec)
+
     result_by_sector = {}
-    for sector in sectors:
-
-        result = None
-        for meic_spec in dfms:
-            meic_spec_name = meic_spec.get('meic_spec')
-            df_mix = np.ma.copy(load_mix(mix_year, month, sector, meic_spec_name, mix_ver))
-
-            # 对于MIX数据 需要进行裁剪和投影转换
-            if mix_ver == '1':
-                latitudes = np.arange(-20.25, 90, 0.25)
-            else:
-                latitudes = np.arange(-14.95, 60.05, 0.1)
-
-            # 对MIX数据进行投影转换
-            area_array = calc_area(latitudes, mix_ver)
-            df_mix /= np.expand_dims(area_array, 1)
-            projected_data = projection(df_mix)
-
-            df_meic = load_asc(year, month, sector, meic_spec_name)
-            # 叠加MIX和MEIC排放
-            projected_data += df_meic
-
-            # 转换单位
-            df = pd.read_csv(f"./factor/{config.get('base', 'model')}/species-convert.csv")
-            # 将数据转换成键-值形式的map
-            model_species_map = dict(zip(df['species'], df['unit_convert']))
-            projected_data *= model_species_map[meic_spec.get('model_spec')]
-
-            # 垂直分配
-            df = pd.read_csv(f"./factor/{config.get('base', 'model')}/layer.csv")
-            coefficients = df[df['sector'] == sector].iloc[0, 1:].values.astype(np.float32)
-            projected_data = projected_data.reshape(1, *projected_data.shape) * coefficients.reshape(-1, 1, 1)
-
-            # 物种分配权重
-            projected_data *= meic_spec.get('weight')
-            if result is None:
-                result = projected_data
-            else:
-                result += projected_data
-
-        result[result < 0] = 0
-        result_by_sector[sector] = result
+    for sector_index, sector in enumerate(month_data.sectors):
+        # 垂直分配
+        coefficients = month_data.profiles[sector_index]
+        surface = month_data.surface[spec_index, sector_index]
+        result_by_sector[sector] = surface.reshape(1, *surface.shape) * coefficients.reshape(-1, 1, 1)
 
     return result_by_sector
@@ -1,11 +1,13 @@
-import os
+import atexit
 from functools import lru_cache
 
 import numpy as np
 import netCDF4 as nc
 
-from meic2ctm.config import config
-from meic2ctm.factor import load_pm_factor
+from meic2ctm.cache import cached_array
+from meic2ctm.output import netcdf_lock
+from meic2ctm.profiling import profiler
+from meic2ctm.projection import mix_window
 
 sector_mapping = {
     'power': 'POWER',
@@ -16,7 +18,50 @@ sector_mapping = {
 }
 
 
-@lru_cache(maxsize=128)
+@lru_cache(maxsize=2)
+def load_mask(version):
+    # 中国区域掩膜，只保留覆盖模拟域的窗口
+    if version == '1':
+        mask = np.loadtxt('./factor/mask_china.csv', delimiter=",", dtype=np.int8)
+    else:
+        mask = np.loadtxt('./factor/mask_mix_v2_china.csv', delimiter=",", dtype=np.int8)
+    rows, cols = mix_window(version)
+    return mask[rows, cols]
+
+
+# 已打开的MIX文件，整个运行期间复用
+mix_files = {}
+
+
+def open_mix(nc_path):
+    with netcdf_lock:
+        if nc_path not in mix_files:
+            mix_files[nc_path] = nc.Dataset(nc_path, 'r')
+        return mix_files[nc_path]
+
+
+@atexit.register
+def close_mix():
+    with netcdf_lock:
+        for nc_file in mix_files.values():
+            nc_file.close()
+        mix_files.clear()
+
+
+def read_window(nc_file, var_name, month, version):
+    # 只读取覆盖模拟域的窗口
+    rows, cols = mix_window(version)
+    with netcdf_lock:
+        return nc_file.variables[var_name][month - 1, rows, cols]
+
+
+def empty_window(version):
+    rows, cols = mix_window(version)
+    return np.zeros((rows.stop - rows.start, cols.stop - cols.start))
+
+
+@cached_array(month_arg=1, per_domain=False)
+@profiler.timed('load_mix', count_bytes=True)
 def load_mix(year, month, sector, species, version):
     if version == '1':
         return load_mix_v1(year, month, sector, species)
@@ -26,86 +71,57 @@ def load_mix(year, month, sector, species, version):
 
 def load_mix_v1(year, month, sector, species):
     nc_path = f'./input/MIX/MIX_V1/MIX_{year}/MICS_Asia_{species}_{year}_0.25x0.25.nc'
-    pm_factor = None
-
-    mask_china = np.loadtxt('./factor/mask_china.csv', delimiter=",", dtype=np.int8)
+    mask_china = load_mask('1')
 
     if 'PMcoarse' in nc_path:
-        pm10 = nc.Dataset(nc_path.replace('PMcoarse', 'PM10'), 'r')
-        pm25 = nc.Dataset(nc_path.replace('PMcoarse', 'PM25'), 'r')
+        pm10 = open_mix(nc_path.replace('PMcoarse', 'PM10'))
+        pm25 = open_mix(nc_path.replace('PMcoarse', 'PM25'))
         if "PM10_" + sector_mapping.get(sector) in pm10.variables:
-            variable_data = pm10.variables["PM10_" + sector_mapping.get(sector)][month - 1]
-            variable_data -= pm25.variables["PM2.5_" + sector_mapping.get(sector)][month - 1]
+            variable_data = read_window(pm10, "PM10_" + sector_mapping.get(sector), month, '1')
+            variable_data -= read_window(pm25, "PM2.5_" + sector_mapping.get(sector), month, '1')
             result = variable_data * mask_china
         else:
-            result = np.zeros((441, 560))
-
-    elif not os.path.exists(nc_path):
-        pm_factor = load_pm_factor(config.get('base', 'model'), sector, species)
-        nc_path = nc_path.replace(species, 'PM25')
-        nc_file = nc.Dataset(nc_path, 'r')
-
-        if "PM2.5_" + sector_mapping.get(sector) in nc_file.variables:
-            variable_data = nc_file.variables["PM2.5_" + sector_mapping.get(sector)][month - 1]
-            result = variable_data * mask_china
-        else:
-            result = np.zeros((441, 560))
+            result = empty_window('1')
 
     else:
-        nc_file = nc.Dataset(nc_path, 'r')
+        nc_file = open_mix(nc_path)
 
         if species == 'PM25':
             species = 'PM2.5'
 
         if species + "_" + sector_mapping.get(sector) in nc_file.variables:
-            variable_data = nc_file.variables[species + "_" + sector_mapping.get(sector)][month - 1]
+            variable_data = read_window(nc_file, species + "_" + sector_mapping.get(sector), month, '1')
             result = variable_data * mask_china
         else:
-            result = np.zeros((441, 560))
+            result = empty_window('1')
 
-    if pm_factor:
-        result *= pm_factor
     return result
 
 
 def load_mix_v2(year, month, sector, spec):
     nc_path = f'./input/MIX/MIX_V2/{year}/MIXv2.3_{spec}_{year}_monthly_0.1deg.nc'
 
-    pm_factor = None
     sector_title = sector.title()
     var_name = f'{spec}_{sector_title}'
 
-    mask_china = np.loadtxt('./factor/mask_mix_v2_china.csv', delimiter=",", dtype=np.int8)
+    mask_china = load_mask('2')
 
     if 'PMcoarse' in nc_path:
-        pm10 = nc.Dataset(nc_path.replace('PMcoarse', 'PM10'), 'r')
-        pm25 = nc.Dataset(nc_path.replace('PMcoarse', 'PM25'), 'r')
+        pm10 = open_mix(nc_path.replace('PMcoarse', 'PM10'))
+        pm25 = open_mix(nc_path.replace('PMcoarse', 'PM25'))
         if f"PM10_{sector_title}" in pm10.variables:
-            variable_data = pm10.variables[f"PM10_{sector_title}"][month - 1]
-            variable_data -= pm25.variables[f"PM25_{sector_title}"][month - 1]
-            result = variable_data * mask_china
-        else:
-            result = np.zeros((750, 940))
-
-    elif not os.path.exists(nc_path):
-        pm_factor = load_pm_factor(config.get('base', 'model'), sector, spec)
-        nc_path = nc_path.replace(spec, 'PM25')
-        nc_file = nc.Dataset(nc_path, 'r')
-
-        if f"PM25_{sector_title}" in nc_file.variables:
-            variable_data = nc_file.variables[f"PM25_{sector_title}"][month - 1]
+            variable_data = read_window(pm10, f"PM10_{sector_title}", month, '2')
+            variable_data -= read_window(pm25, f"PM25_{sector_title}", month, '2')
             result = variable_data * mask_china
         else:
-            result = np.zeros((750, 940))
+            result = empty_window('2')
 
     else:
-        nc_file = nc.Dataset(nc_path, 'r')
+        nc_file = open_mix(nc_path)
         if var_name in nc_file.variables:
-            variable_data = nc_file.variables[var_name][month - 1]
+            variable_data = read_window(nc_file, var_name, month, '2')
             result = variable_data * mask_china
         else:
-            result = np.zeros((750, 940))
+            result = empty_window('2')
 
-    if pm_factor:
-        result *= pm_factor
     return result
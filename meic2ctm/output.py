@@ -0,0 +1,71 @@
+import os
+import shutil
+import threading
+
+import netCDF4 as nc
+
+from .config import config
+
+# netCDF-C库非线程安全，所有线程对netCDF文件的访问需持有此锁
+netcdf_lock = threading.RLock()
+
+
+def output_format():
+    return config.get('base', 'output_format', fallback='NETCDF3_CLASSIC')
+
+
+def output_file(name):
+    """
+    输出目录下的文件路径，输出目录由 output_path 配置，默认为 output。
+    """
+    return os.path.join(config.get('base', 'output_path', fallback='output'), name)
+
+
+def tagged_sectors():
+    """
+    需单独输出的部门。tag_sectors = true 时为全部部门，分部门文件位于输出目录下以部门命名的子目录中。
+    """
+    if config.getboolean('base', 'tag_sectors', fallback=False):
+        return config.get('base', 'sectors').split(',')
+    return []
+
+
+def create_output(file):
+    """
+    新建输出文件，已存在时覆盖。文件格式由 output_format 配置，默认为 NETCDF3_CLASSIC。
+    """
+    os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+    if os.path.exists(file):
+        os.remove(file)
+    return nc.Dataset(file, 'w', format=output_format())
+
+
+def clone_output(template, file):
+    """
+    复制已定义好维度、属性和变量的模板文件作为新的输出文件，并以追加方式打开。
+    """
+    os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+    shutil.copyfile(template, file)
+    return nc.Dataset(file, 'a')
+
+
+def variable_options(chunksizes):
+    """
+    排放变量的分块和压缩参数，仅在NETCDF4/NETCDF4_CLASSIC格式下生效。
+
+    Args:
+        chunksizes (tuple): 分块大小，通常为 (1, LAY, ROW, COL)。
+
+    Returns:
+        dict: createVariable的关键字参数。
+
+    """
+    if not output_format().startswith('NETCDF4'):
+        return {}
+
+    options = {'chunksizes': chunksizes}
+    compress_level = config.getint('base', 'compress_level', fallback=0)
+    if compress_level > 0:
+        options.update(zlib=True, complevel=compress_level,
+                       shuffle=config.getboolean('base', 'shuffle', fallback=True))
+    return options
@@ -0,0 +1,83 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from . import meic
+from .cache import array_cache, cache_dir, save_array
+from .profiling import profiler
+
+
+def share_month(year, month, basedir):
+    """
+    在主进程中计算某月排放，并将地面排放写入内存映射文件供工作进程读取。
+
+    Returns:
+        MonthEmission: surface字段为内存映射文件路径。
+
+    """
+    month_data = meic.load_meic_month(year, month, basedir)
+    path = os.path.join(cache_dir('shared'), f'{year}{str(month).zfill(2)}.{basedir}.{os.getpid()}.npy')
+    save_array(path, month_data.surface)
+    return month_data._replace(surface=path)
+
+
+def attach_months(shared):
+    # 工作进程以只读内存映射方式打开主进程共享的月排放
+    meic.shared_months.clear()
+    for key, month_data in shared.items():
+        meic.shared_months[key] = month_data._replace(surface=np.load(month_data.surface, mmap_mode='r'))
+
+
+def run_task(func, shared, args):
+    attach_months(shared)
+    # 工作进程只返回本任务的阶段统计，由主进程合并
+    profiler.reset()
+    func(*args)
+    return profiler.snapshot()
+
+
+def run_parallel(func, tasks, workers, on_done=None):
+    """
+    使用进程池并行执行相互独立的输出任务。每个月的排放只在主进程计算一次，
+    通过内存映射文件共享给工作进程，不经过pickle传输；某月的任务全部完成后删除其共享文件。
+
+    Args:
+        func (callable): 模块级的任务函数。
+        tasks (list): [(args, months)]，args为func的参数，months为任务所需的 [(year, month, basedir)]。
+        workers (int): 进程数。
+        on_done (callable): 任务成功完成后在主进程中以args调用，可为None。
+
+    """
+    shared = {}
+    users = {}
+    context = multiprocessing.get_context('fork')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {}
+            for i, (args, months) in enumerate(tasks):
+                # 之后的任务不再需要的月份，释放其在主进程中的缓存（多个模型共用同一月份的投影结果）
+                array_cache.release_months({key[1] for _, later in tasks[i:] for key in later if key not in shared})
+                for key in months:
+                    if key not in shared:
+                        shared[key] = share_month(*key)
+                    users[key] = users.get(key, 0) + 1
+                future = pool.submit(run_task, func, {key: shared[key] for key in months}, args)
+                futures[future] = args, months
+
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    pool.shutdown(cancel_futures=True)
+                    raise future.exception()
+                profiler.merge(future.result())
+                args, months = futures[future]
+                if on_done is not None:
+                    on_done(*args)
+                for key in months:
+                    users[key] -= 1
+                    if users[key] == 0:
+                        os.remove(shared.pop(key).surface)
+    finally:
+        for month_data in shared.values():
+            os.remove(month_data.surface)
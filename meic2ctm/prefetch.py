@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from . import meic
+from .factor import control_file
+
+
+class MonthPrefetcher:
+    """
+    在后台线程中提前加载后续月份的排放数据。MIX/asc读取和numpy计算会释放GIL，
+    可与当前月份的计算和写出重叠；主流程只在数据尚未就绪时等待。
+    """
+
+    def __init__(self, max_workers=1):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.requested = set()
+
+    def prefetch(self, year, month, basedir):
+        key = (year, month, basedir)
+        if key in self.requested:
+            return
+        self.requested.add(key)
+        meic.pending_months[key] = self.executor.submit(meic.calc_meic_month, year, month, basedir, control_file())
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        meic.pending_months.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,138 @@
+import sys
+import time
+import json
+import resource
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from .cache import array_cache, lru_caches, sizeof
+
+
+def peak_rss():
+    # 进程的峰值常驻内存（字节），Linux下ru_maxrss单位为KB，macOS下为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def lru_cache_stats():
+    """
+    收集meic2ctm各模块中lru_cache的命中情况。
+
+    Returns:
+        dict: 函数全名到 {'hits', 'misses', 'currsize'} 的映射。
+
+    """
+    stats = {}
+    for name, func in lru_caches().items():
+        info = func.cache_info()
+        stats[name] = {'hits': info.hits, 'misses': info.misses, 'currsize': info.currsize}
+    return stats
+
+
+class Profiler:
+    """
+    分阶段记录耗时、调用次数、读取的字节数和阶段结束时的进程峰值内存。
+    未启用时各记录点只做一次判断；阶段可以嵌套，耗时为包含子阶段的总时间。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = None
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.perf_counter()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+
+    def add(self, name, seconds, nbytes=0):
+        rss = peak_rss()
+        with self.lock:
+            stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'peak_rss': 0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += nbytes
+            stats['peak_rss'] = max(stats['peak_rss'], rss)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, name, count_bytes=False):
+        """
+        记录被装饰函数的耗时，count_bytes为True时将返回数组的字节数计为读取量。
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                result = func(*args, **kwargs)
+                self.add(name, time.perf_counter() - start, sizeof(result) if count_bytes else 0)
+                return result
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stages.items()}
+
+    def merge(self, stages):
+        # 合并工作进程的记录
+        with self.lock:
+            for name, other in stages.items():
+                stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'peak_rss': 0})
+                stats['calls'] += other['calls']
+                stats['seconds'] += other['seconds']
+                stats['bytes'] += other['bytes']
+                stats['peak_rss'] = max(stats['peak_rss'], other['peak_rss'])
+
+    def report(self):
+        lines = [f'{"stage":<22}{"calls":>8}{"seconds":>12}{"MB read":>12}{"peak RSS MB":>14}']
+        for name, stats in sorted(self.snapshot().items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f'{name:<22}{stats["calls"]:>8}{stats["seconds"]:>12.2f}'
+                         f'{stats["bytes"] / 2 ** 20:>12.1f}{stats["peak_rss"] / 2 ** 20:>14.1f}')
+        lines.append(f'wall time {time.perf_counter() - self.started:.2f} s, peak RSS {peak_rss() / 2 ** 20:.1f} MB')
+        lines.append(array_cache.report())
+        for name, stats in sorted(lru_cache_stats().items()):
+            total = stats['hits'] + stats['misses']
+            if total:
+                lines.append(f'{name}: {stats["hits"]} hits, {stats["misses"]} misses '
+                             f'({stats["hits"] / total:.1%} hit rate)')
+        return '\n'.join(lines)
+
+    def save(self, path):
+        report = {
+            'wall_seconds': time.perf_counter() - self.started,
+            'peak_rss': peak_rss(),
+            'stages': self.snapshot(),
+            'array_cache': {'hits': array_cache.hits, 'misses': array_cache.misses,
+                            'evictions': array_cache.evictions, 'nbytes': array_cache.nbytes},
+            'lru_caches': lru_cache_stats(),
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    def finish(self, json_path=None):
+        """
+        打印各阶段统计，json_path不为None时同时写出JSON报告。
+        """
+        print(self.report())
+        if json_path:
+            self.save(json_path)
+
+
+profiler = Profiler()
@@ -1,14 +1,29 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+
 import numpy as np
-from pyproj import Transformer
 from .config import config
-from functools import lru_cache
+from .cache import cache_dir, cache_key, domain_cache, projection_signature, save_array
+from .domain import domain_names, use_domain
+from .profiling import profiler
 
-idx = 0
-idy = 0
-dest_lat=np.zeros(0)
-dest_lon=np.zeros(0)
-@lru_cache(maxsize=2)
-def projection_base(mix_version):
+# 模拟网格与MIX经纬度网格的对应关系，数组形状均为 (xcells, ycells)
+Grid = namedtuple('Grid', ['dest_x', 'dest_y', 'lat', 'lon', 'dx', 'dy', 'xcells', 'ycells'])
+
+grid_arrays = ('dest_x', 'dest_y', 'lat', 'lon')
+
+# 保守插值的稀疏权重矩阵（CSR格式），行对应模拟网格，列对应MIX网格（全球网格展平后的索引），
+# 权重为MIX网格与模拟网格相交的面积（平方公里）
+RegridMatrix = namedtuple('RegridMatrix', ['indptr', 'indices', 'data'])
+
+regrid_arrays = ('indptr', 'indices', 'data')
+
+
+def mix_axes(mix_version):
+    """
+    MIX清单网格中心的纬度、经度坐标和分辨率。
+    """
     if mix_version == '1':
         latitudes = np.arange(-20.25, 90, 0.25)
         longitudes = np.arange(40, 180, 0.25)
@@ -17,12 +32,26 @@ def projection_base(mix_version):
         latitudes = np.arange(-14.95, 60.05, 0.1)
         longitudes = np.arange(60.05, 154, 0.1)
         resolution = 0.1
+    return latitudes, longitudes, resolution
+
+
+def calc_grid(mix_version):
+    """
+    计算模拟网格中心的经纬度及其在MIX网格中的索引。
+
+    Returns:
+        dict: dest_x、dest_y、lat、lon 四个 (xcells, ycells) 数组。
+
+    """
+    from pyproj import Transformer
+
+    latitudes, longitudes, resolution = mix_axes(mix_version)
     # 定义经纬度坐标系和Lambert投影坐标系
     wgs84 = "EPSG:4326"  # 经纬度坐标系
 
     lambert_params = config.get('projection', 'lambert_params')
 
-    # 创建一个Transformer对象，用于从经纬度坐标系到Lambert投影坐标系的转换
+    # 创建一个Transformer对象，用于从Lambert投影坐标系到经纬度坐标系的转换
     lambert_to_wgs84_transformer = Transformer.from_proj(lambert_params, wgs84)
 
     # 加载投屏配置数据
@@ -34,38 +63,195 @@ def projection_base(mix_version):
     ycells = config.getint('projection', 'ycells')  # y方向网格数
 
     # 计算每个网格单元的中心位置在Lambert投影坐标系下的坐标
-    lambert_xcoords = np.array([xorig + i * dx + dx / 2 for i in range(xcells)])
-    lambert_ycoords = np.array([yorig + j * dy + dy / 2 for j in range(ycells)])
-
-    # 将Lambert投影坐标系下的坐标转换为经纬度坐标系下的坐标
-    dest_x = np.zeros((xcells, ycells), dtype=int)
-    dest_y = np.zeros((xcells, ycells), dtype=int)
-
-    global dest_lat
-    dest_lat = np.zeros((xcells, ycells), dtype=float)
-    global dest_lon
-    dest_lon = np.zeros((xcells, ycells), dtype=float)
-
-    global idx
-    idx = 0
-    global idy
-    for x in lambert_xcoords:
-        idy = 0
-        for y in lambert_ycoords:
-            lat, lon = lambert_to_wgs84_transformer.transform(x, y)
-            dest_lat[idx, idy] = lat
-            dest_lon[idx, idy] = lon
-            dest_y[idx, idy] = np.floor((lat - latitudes[0]) / resolution).astype(int)
-            dest_x[idx, idy] = np.floor((lon - longitudes[0]) / resolution).astype(int)
-            idy += 1
-        idx += 1
-
-    return dest_x, dest_y, dx, dy
-
-
-def projection(original_data, mix_version='1'):
-    dest_x, dest_y, dx, dy = projection_base(mix_version)
-    dest_data = original_data[dest_y, dest_x]
+    lambert_xcoords = xorig + np.arange(xcells) * dx + dx / 2
+    lambert_ycoords = yorig + np.arange(ycells) * dy + dy / 2
+    x, y = np.meshgrid(lambert_xcoords, lambert_ycoords, indexing='ij')
+
+    # 整体转换为经纬度坐标
+    lat, lon = lambert_to_wgs84_transformer.transform(x, y)
+    dest_y = np.floor((lat - latitudes[0]) / resolution).astype(int)
+    dest_x = np.floor((lon - longitudes[0]) / resolution).astype(int)
+
+    return {'dest_x': dest_x, 'dest_y': dest_y, 'lat': lat, 'lon': lon}
+
+
+@domain_cache(maxsize=8)
+def projection_base(mix_version):
+    """
+    加载模拟网格，结果按投影配置和MIX版本缓存到磁盘，再次运行时以内存映射方式读取。
+
+    Args:
+        mix_version (str): MIX清单版本，'1' 或 '2'。
+
+    Returns:
+        Grid: 网格索引、经纬度及网格尺寸。
+
+    """
+    key = cache_key(projection_signature(), mix_version)
+    path = cache_dir('projection', key)
+    files = {name: os.path.join(path, f'{name}.npy') for name in grid_arrays}
+
+    if all(os.path.exists(f) for f in files.values()):
+        arrays = {name: np.load(f, mmap_mode='r') for name, f in files.items()}
+    else:
+        arrays = calc_grid(mix_version)
+        for name, f in files.items():
+            save_array(f, arrays[name])
+
+    return Grid(dx=config.getint('projection', 'dx'),
+                dy=config.getint('projection', 'dy'),
+                xcells=config.getint('projection', 'xcells'),
+                ycells=config.getint('projection', 'ycells'),
+                **arrays)
+
+
+def regrid_mode():
+    return config.get('projection', 'regrid', fallback='nearest')
+
+
+def calc_regrid_matrix(mix_version, samples):
+    """
+    计算MIX网格到模拟网格的保守插值权重。每个模拟网格细分为 samples × samples 个子网格，
+    按子网格中心所在的MIX网格累加相交面积。
+
+    Returns:
+        RegridMatrix: 稀疏权重矩阵。
+
+    """
+    from pyproj import Transformer
+
+    latitudes, longitudes, resolution = mix_axes(mix_version)
+    transformer = Transformer.from_proj(config.get('projection', 'lambert_params'), "EPSG:4326")
+
+    xorig = config.getfloat('projection', 'xorig')
+    yorig = config.getfloat('projection', 'yorig')
+    dx = config.getint('projection', 'dx')
+    dy = config.getint('projection', 'dy')
+    xcells = config.getint('projection', 'xcells')
+    ycells = config.getint('projection', 'ycells')
+    nsource = len(latitudes) * len(longitudes)
+    sample_area = dx * dy / 1000 / 1000 / samples / samples
+
+    # 各子网格中心的x坐标及所在的模拟网格列号
+    sub_x = xorig + (np.arange(xcells * samples) + 0.5) * dx / samples
+    sub_i = np.repeat(np.arange(xcells), samples)
+
+    keys = []
+    counts = []
+    # 逐行计算以限制内存占用
+    for j in range(ycells):
+        sub_y = yorig + j * dy + (np.arange(samples) + 0.5) * dy / samples
+        x, y = np.meshgrid(sub_x, sub_y)
+        lat, lon = transformer.transform(x, y)
+        src_y = np.floor((lat - latitudes[0]) / resolution).astype(np.int64)
+        src_x = np.floor((lon - longitudes[0]) / resolution).astype(np.int64)
+        valid = (src_y >= 0) & (src_y < len(latitudes)) & (src_x >= 0) & (src_x < len(longitudes))
+
+        target = j * xcells + np.broadcast_to(sub_i, x.shape)
+        key, count = np.unique((target * nsource + src_y * len(longitudes) + src_x)[valid], return_counts=True)
+        keys.append(key)
+        counts.append(count)
+
+    keys = np.concatenate(keys)
+    rows = keys // nsource
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=xcells * ycells))])
+    return RegridMatrix(indptr, keys % nsource, np.concatenate(counts) * sample_area)
+
+
+@domain_cache(maxsize=8)
+def load_regrid_matrix(mix_version):
+    """
+    加载保守插值权重矩阵，结果按投影配置、MIX版本和细分数缓存到磁盘。
+    """
+    samples = config.getint('projection', 'regrid_samples', fallback=10)
+    key = cache_key(projection_signature(), mix_version, samples)
+    path = cache_dir('regrid', key)
+    files = {name: os.path.join(path, f'{name}.npy') for name in regrid_arrays}
+
+    if all(os.path.exists(f) for f in files.values()):
+        return RegridMatrix(**{name: np.load(f, mmap_mode='r') for name, f in files.items()})
+
+    matrix = calc_regrid_matrix(mix_version, samples)
+    for name, f in files.items():
+        save_array(f, getattr(matrix, name))
+    return matrix
+
+
+def domain_window(mix_version):
+    # 覆盖当前模拟域的MIX网格索引范围
+    if regrid_mode() == 'conservative':
+        _, longitudes, _ = mix_axes(mix_version)
+        src_y, src_x = np.divmod(np.asarray(load_regrid_matrix(mix_version).indices), len(longitudes))
+    else:
+        grid = projection_base(mix_version)
+        src_y, src_x = grid.dest_y, grid.dest_x
+    return int(src_y.min()), int(src_y.max()) + 1, int(src_x.min()), int(src_x.max()) + 1
+
+
+@lru_cache(maxsize=2)
+def mix_window(mix_version):
+    """
+    覆盖全部模拟域的MIX网格索引范围，读取MIX数据时只需读取该窗口。配置了嵌套域时取各模拟域窗口的并集，
+    各模拟域共用同一份MIX读取结果。
+
+    Returns:
+        tuple: (rows, cols) 两个slice，分别对应MIX数据的纬度和经度维。
+
+    """
+    windows = []
+    for name in domain_names():
+        with use_domain(name):
+            windows.append(domain_window(mix_version))
+    y0, y1, x0, x1 = zip(*windows)
+    return slice(min(y0), max(y1)), slice(min(x0), max(x1))
+
+
+@domain_cache(maxsize=8)
+def window_regrid_matrix(mix_version):
+    # 将权重矩阵的列索引换算为窗口内展平后的索引，并展开CSR的行号
+    _, longitudes, _ = mix_axes(mix_version)
+    rows, cols = mix_window(mix_version)
+    matrix = load_regrid_matrix(mix_version)
+    src_y, src_x = np.divmod(np.asarray(matrix.indices), len(longitudes))
+    indices = (src_y - rows.start) * (cols.stop - cols.start) + (src_x - cols.start)
+    targets = np.repeat(np.arange(len(matrix.indptr) - 1), np.diff(matrix.indptr))
+    return targets, indices, np.asarray(matrix.data)
+
+
+def regrid_conservative(window_data, mix_version):
+    """
+    以稀疏矩阵乘法将MIX窗口数据保守插值到模拟网格。
+
+    Returns:
+        np.ndarray: (ycells, xcells) 的float32数组，为各模拟网格的排放总量。
+
+    """
+    grid = projection_base(mix_version)
+    targets, indices, weights = window_regrid_matrix(mix_version)
+    values = np.ma.getdata(window_data).ravel()[indices] * weights
+    dest_data = np.bincount(targets, weights=values, minlength=grid.xcells * grid.ycells)
+    return dest_data.reshape(grid.ycells, grid.xcells).astype(np.float32)
+
+
+@profiler.timed('projection')
+def projection(window_data, mix_version='1'):
+    """
+    将MIX窗口数据插值到模拟网格，默认按最近网格采样，regrid = conservative 时按面积保守插值。
+
+    Args:
+        window_data (np.ndarray): mix_window范围内的MIX数据（单位面积排放）。
+        mix_version (str): MIX清单版本。
+
+    Returns:
+        np.ndarray: (ycells, xcells) 的float32数组。
+
+    """
+    if regrid_mode() == 'conservative':
+        return regrid_conservative(window_data, mix_version)
+
+    grid = projection_base(mix_version)
+    rows, cols = mix_window(mix_version)
+    dest_data = window_data[grid.dest_y - rows.start, grid.dest_x - cols.start]
     dest_data = np.transpose(dest_data)
-    dest_data *= (dx * dy / 1000 / 1000)
+    dest_data *= (grid.dx * grid.dy / 1000 / 1000)
     return np.array(dest_data.data, dtype=np.float32)
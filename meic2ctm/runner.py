@@ -0,0 +1,177 @@
+import datetime
+from collections import namedtuple
+
+from . import cmaq, wrfchem
+from .cache import array_cache
+from .config import config
+from .domain import base_domain, domain_name, domain_names, use_domain
+from .manifest import Manifest, output_signature
+from .output import output_file
+from .parallel import run_parallel
+from .prefetch import MonthPrefetcher
+from .projection import mix_window
+from .temporal import OverlapCarry, month_segments
+
+# 输出格式名称到写出模块的映射，写出模块提供first_time、file_times、output_files、write_day，
+# 以及用于检查输出的expected_times和read_times
+writers = {
+    'cmaq': cmaq,
+    'wrfchem': wrfchem,
+}
+
+# 一个输出目标：写出格式及其使用的模型机制（factor下的目录）
+Target = namedtuple('Target', ['writer', 'basedir'])
+
+
+def parse_target(text):
+    """
+    解析 writer[:basedir] 形式的输出目标，未指定模型机制时与写出格式同名。
+
+    Returns:
+        Target: 输出目标。
+
+    """
+    writer, _, basedir = text.partition(':')
+    if writer not in writers:
+        raise ValueError(f'unknown output format: {writer}')
+    return Target(writer, basedir or writer)
+
+
+def target_name(target):
+    return f'{target.writer}:{target.basedir}'
+
+
+def manifest_target(target):
+    # manifest中记录的输出目标，嵌套域的输出附加模拟域名
+    name = target_name(target)
+    return name if domain_name() == base_domain() else f'{name}@{domain_name()}'
+
+
+def target_months(target, day):
+    # 某目标某天的文件所需的月份，day为当天0时或文件起始时刻
+    writer = writers[target.writer]
+    return [(year, month, target.basedir)
+            for year, month, _, _ in month_segments(writer.file_times(writer.first_time(day.replace(hour=0))))]
+
+
+def write_target_day(writer, ts, basedir, carry=None):
+    writers[writer].write_day(ts, basedir, carry)
+
+
+def plan_jobs(targets, days, manifest, resume=False, force=False):
+    """
+    确定需要生成的输出。默认跳过manifest中签名一致的文件；resume时跳过各目标最后完成的文件及其之前的文件。
+
+    Returns:
+        list: [(target, ts, signature)]，按日期排序。
+
+    """
+    last = {target: manifest.last_completed(manifest_target(target)) if resume else None for target in targets}
+
+    jobs = []
+    for day in days:
+        for target in targets:
+            writer = writers[target.writer]
+            ts = writer.first_time(day)
+            if not force and last[target] is not None and ts <= last[target]:
+                continue
+            months = [(year, month) for year, month, _ in target_months(target, day)]
+            signature = output_signature(target.writer, target.basedir, months)
+            if not force and manifest.is_current(writer.output_files(ts), signature):
+                continue
+            jobs.append((target, ts, signature))
+    return jobs
+
+
+def run_days(targets, days, workers=1, resume=False, force=False):
+    """
+    在当前模拟域逐天写出一个或多个输出目标，参数见run。
+    """
+    manifest = Manifest()
+    jobs = plan_jobs(targets, days, manifest, resume, force)
+    print(f'{len(jobs)} of {len(days) * len(targets)} outputs to write')
+
+    signatures = {(target.writer, ts, target.basedir): signature for target, ts, signature in jobs}
+
+    def complete(writer, ts, basedir):
+        manifest.record(writers[writer].output_files(ts), manifest_target(Target(writer, basedir)), ts,
+                        signatures[(writer, ts, basedir)])
+
+    manifest.discard([name for target, ts, _ in jobs for name in writers[target.writer].output_files(ts)])
+
+    if workers > 1:
+        # 各天相互独立，按天分配到进程池
+        tasks = [((target.writer, ts, target.basedir), target_months(target, ts)) for target, ts, _ in jobs]
+        run_parallel(write_target_day, tasks, workers, on_done=complete)
+    else:
+        day_jobs = {}
+        for target, ts, _ in jobs:
+            day_jobs.setdefault(ts.date(), []).append((target, ts))
+        job_days = list(day_jobs)
+
+        prefetch_days = config.getint('time', 'prefetch_days', fallback=2)
+        carries = {target: OverlapCarry() for target in targets}
+        with MonthPrefetcher() as prefetcher:
+            for i, day in enumerate(job_days):
+                keys = [key for later in job_days[i:i + 1 + prefetch_days] for target, ts in day_jobs[later]
+                        for key in target_months(target, ts)]
+                # 当前及之后几天都不需要的月份，释放其缓存
+                array_cache.release_months({month for _, month, _ in keys})
+                # 后台预读之后几天所需的月份，跨月时无需同步等待数据加载
+                for key in keys:
+                    prefetcher.prefetch(*key)
+                for target, ts in day_jobs[day]:
+                    write_target_day(target.writer, ts, target.basedir, carries[target])
+                    complete(target.writer, ts, target.basedir)
+
+
+def run(targets, start, end, workers=1, resume=False, force=False):
+    """
+    逐天写出一个或多个输出目标。所有目标在同一进程中运行，共享输入读取、投影、调控系数和时间分配的缓存；
+    相同模型机制的目标共享物种分配结果。输出目录下的manifest记录已完成的文件，重新运行时只生成过期或缺失的文件。
+
+    配置了嵌套域（[projection.d02] 等配置节）时按月分段，每段依次写出各模拟域：MIX读取、分配系数和时间分配
+    在各模拟域间共享，投影、MEIC读取和调控系数网格按模拟域分别计算和缓存，输出文件名中的d01替换为各模拟域名。
+
+    Args:
+        targets (list): [Target]。
+        start (str): 起始日期，%Y-%m-%d。
+        end (str): 结束日期，%Y-%m-%d。
+        workers (int): 进程数，大于1时各天各目标分配到进程池。
+        resume (bool): 从各目标最后完成的文件之后继续。
+        force (bool): 忽略manifest，重新生成全部文件。
+
+    Returns:
+        list: 起止日期内各模拟域各目标的全部输出文件路径，包括因已是最新而跳过的文件。
+
+    """
+    day = datetime.datetime.strptime(start, '%Y-%m-%d')
+    te = datetime.datetime.strptime(end, '%Y-%m-%d')
+
+    days = []
+    while day <= te:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+
+    names = domain_names()
+    if len(names) == 1:
+        run_days(targets, days, workers, resume, force)
+    else:
+        # 切换模拟域会修改全局配置，各模拟域共用的MIX窗口需在预读线程启动前计算
+        mix_window(config.get('inventory', 'mix_inventory_version'))
+        chunks = {}
+        for day in days:
+            chunks.setdefault((day.year, day.month), []).append(day)
+        for chunk in chunks.values():
+            for name in names:
+                with use_domain(name):
+                    print(f'domain {name}: {chunk[0]:%Y-%m-%d} - {chunk[-1]:%Y-%m-%d}')
+                    run_days(targets, chunk, workers, resume, force)
+
+    print(array_cache.report())
+    files = []
+    for name in names:
+        with use_domain(name):
+            files.extend(output_file(file) for day in days for target in targets
+                         for file in writers[target.writer].output_files(writers[target.writer].first_time(day)))
+    return files
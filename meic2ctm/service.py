@@ -0,0 +1,289 @@
+import json
+import time
+import datetime
+import itertools
+import threading
+import traceback
+import multiprocessing
+import urllib.request
+from multiprocessing.connection import wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import meic
+from .cache import array_cache
+from .config import config
+from .domain import domain_names, use_domain
+from .factor import control_file
+from .mix import close_mix
+from .runner import Target, parse_target, run, target_months, target_name
+
+
+class Job:
+    """
+    一个排放生成任务：起止日期、输出目标、输出目录和调控文件。
+    """
+
+    def __init__(self, job_id, request):
+        self.id = job_id
+        self.start = request['start']
+        self.end = request.get('end') or self.start
+        for value in (self.start, self.end):
+            datetime.datetime.strptime(value, '%Y-%m-%d')
+        if self.end < self.start:
+            raise ValueError('end is earlier than start')
+        targets = request.get('targets') or [target_name(Target('cmaq', config.get('base', 'model')))]
+        self.targets = [parse_target(target) for target in targets]
+        self.output_path = request.get('output_path') or config.get('base', 'output_path', fallback='output')
+        # 未给出control_file时使用服务配置中的调控文件，显式给出null时不调控
+        self.control_file = request['control_file'] if 'control_file' in request else control_file()
+        self.force = bool(request.get('force', False))
+        self.resume = bool(request.get('resume', False))
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.files = []
+        self.error = None
+
+    def days(self):
+        day = datetime.datetime.strptime(self.start, '%Y-%m-%d')
+        te = datetime.datetime.strptime(self.end, '%Y-%m-%d')
+        while day <= te:
+            yield day
+            day += datetime.timedelta(days=1)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'start': self.start,
+            'end': self.end,
+            'targets': [target_name(target) for target in self.targets],
+            'output_path': self.output_path,
+            'control_file': self.control_file,
+            'submitted': datetime.datetime.fromtimestamp(self.submitted).isoformat(timespec='seconds'),
+            'queue_seconds': (self.started or time.time()) - self.submitted,
+            'run_seconds': (self.finished or time.time()) - self.started if self.started else None,
+            'files': self.files,
+            'error': self.error,
+        }
+
+
+def run_job(job, conn):
+    # 在fork出的子进程中运行，继承主进程已加载的缓存
+    config.set('base', 'output_path', job.output_path)
+    if job.control_file is None:
+        config.remove_option('inventory', 'control_file')
+    else:
+        config.set('inventory', 'control_file', job.control_file)
+    try:
+        conn.send(('done', run(job.targets, job.start, job.end, 1, job.resume, job.force)))
+    except Exception:
+        conn.send(('failed', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """
+    任务队列。调度线程在主进程中加载任务所需月份的排放（常驻于array_cache，由后续任务复用），
+    再fork子进程完成时间分配和写出，同时运行的任务数不超过max_jobs。输出目录相同的任务依次运行，
+    避免同时写同一个manifest。
+
+    只有调度线程修改缓存、fork和输出日志，HTTP线程只通过condition访问任务表。
+    """
+
+    def __init__(self, max_jobs=1):
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.running = {}
+        self.cached_months = []
+        self.cache_report = array_cache.report()
+        self.context = multiprocessing.get_context('fork')
+        self.dispatcher = threading.Thread(target=self.dispatch, name='dispatcher', daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, request):
+        with self.condition:
+            job = Job(str(next(self.ids)), request)
+            self.jobs[job.id] = job
+            self.condition.notify()
+            return job
+
+    def ready_job(self):
+        # 第一个可以开始的任务，需在condition内调用
+        if len(self.running) >= self.max_jobs:
+            return None
+        busy = {job.output_path for job, _ in self.running.values()}
+        return next((job for job in self.jobs.values() if job.status == 'queued' and job.output_path not in busy),
+                    None)
+
+    def dispatch(self):
+        while True:
+            self.collect()
+            with self.condition:
+                job = self.ready_job()
+                if job is None:
+                    if not self.running:
+                        self.condition.wait(timeout=1)
+                    continue
+                job.status = 'running'
+                job.started = time.time()
+            self.start(job)
+
+    def warm(self, job):
+        """
+        加载任务所需月份各模拟域的排放。已缓存的月份直接命中，主进程中的缓存在任务结束后保留。
+        """
+        months = sorted({key for day in job.days() for target in job.targets for key in target_months(target, day)})
+        for name in domain_names():
+            with use_domain(name):
+                for year, month, basedir in months:
+                    meic.calc_meic_month(year, month, basedir, job.control_file)
+        self.cached_months = sorted({key[2:] for key in list(array_cache.entries)
+                                     if key[:2] == ('meic2ctm.meic', 'calc_meic_month')}, key=str)
+        self.cache_report = array_cache.report()
+
+    def start(self, job):
+        try:
+            self.warm(job)
+        except Exception:
+            with self.condition:
+                job.status, job.error, job.finished = 'failed', traceback.format_exc(), time.time()
+            print(f'job {job.id} failed while loading emissions')
+            return
+        # MIX文件句柄不能跨进程共享，fork前关闭
+        close_mix()
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=run_job, args=(job, sender), daemon=True)
+        process.start()
+        sender.close()
+        with self.condition:
+            self.running[receiver] = (job, process)
+        print(f'job {job.id} started: {job.start} - {job.end} {[target_name(t) for t in job.targets]}')
+
+    def collect(self):
+        # 收集已结束的子进程的结果，最多等待1秒
+        if not self.running:
+            return
+        for receiver in wait(list(self.running), timeout=1):
+            job, process = self.running[receiver]
+            try:
+                status, result = receiver.recv()
+            except EOFError:
+                status, result = 'failed', 'worker process exited unexpectedly'
+            receiver.close()
+            process.join()
+            with self.condition:
+                del self.running[receiver]
+                job.status, job.finished = status, time.time()
+                if status == 'done':
+                    job.files = result
+                else:
+                    job.error = result
+            print(f'job {job.id} {status} in {job.finished - job.started:.1f} s')
+
+    def status(self):
+        with self.condition:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'jobs': counts, 'max_jobs': self.max_jobs, 'cached_months': self.cached_months,
+                    'array_cache': self.cache_report}
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs 提交任务，GET /jobs、GET /jobs/<id> 查询任务，GET /status 查询队列和缓存状态。
+    """
+
+    def send_json(self, code, body):
+        data = json.dumps(body, indent=1).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        queue = self.server.queue
+        path = self.path.rstrip('/')
+        if path == '/status':
+            self.send_json(200, queue.status())
+        elif path == '/jobs':
+            with queue.condition:
+                body = [job.to_dict() for job in queue.jobs.values()]
+            self.send_json(200, body)
+        elif path.startswith('/jobs/'):
+            with queue.condition:
+                job = queue.jobs.get(path[len('/jobs/'):])
+                body = job.to_dict() if job else None
+            if body is None:
+                self.send_json(404, {'error': 'no such job'})
+            else:
+                self.send_json(200, body)
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.queue.submit(request)
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {'error': f'invalid job request: {e!r}'})
+            return
+        self.send_json(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        # 日志由调度线程统一输出
+        pass
+
+
+def serve(host='127.0.0.1', port=8642, max_jobs=1):
+    """
+    以常驻服务方式运行，在 http://host:port 接受任务。投影网格、分配系数表和各月的排放在任务间保留，
+    所需月份均已缓存的任务只需做时间分配和写出。
+
+    Args:
+        host (str): 监听地址，默认只接受本机连接。
+        port (int): 监听端口。
+        max_jobs (int): 同时运行的任务数。
+
+    """
+    queue = JobQueue(max_jobs)
+    server = ThreadingHTTPServer((host, port), JobHandler)
+    server.queue = queue
+    print(f'meic2ctm service listening on http://{host}:{port} with {max_jobs} job slots')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def request_json(url, body=None):
+    data = None if body is None else json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def submit(url, request, wait_done=True, interval=1):
+    """
+    向服务提交任务，wait_done为True时轮询直到任务结束。
+
+    Returns:
+        dict: 任务状态。
+
+    """
+    job = request_json(f'{url}/jobs', request)
+    while wait_done and job['status'] in ('queued', 'running'):
+        time.sleep(interval)
+        job = request_json(f'{url}/jobs/{job["id"]}')
+    return job
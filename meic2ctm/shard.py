@@ -0,0 +1,146 @@
+import os
+import math
+import calendar
+import datetime
+import configparser
+
+from .config import config
+from .domain import domain_names, use_domain
+from .manifest import Manifest, output_signature
+from .output import output_file
+from .runner import target_months, writers
+
+
+def month_end(day, months=1):
+    # day所在月份之后第months个月的最后一天
+    year, month = divmod(day.year * 12 + day.month - 1 + months - 1, 12)
+    return datetime.datetime(year, month + 1, calendar.monthrange(year, month + 1)[1])
+
+
+def plan_shards(start, end, months=1, shards=None):
+    """
+    将起止日期按自然月切分为若干分片。每个分片包含完整的月份（首尾分片除外），
+    各月的MEIC、MIX数据只在一个分片中读取和投影。
+
+    Args:
+        start (str): 起始日期，%Y-%m-%d。
+        end (str): 结束日期，%Y-%m-%d。
+        months (int): 每个分片的月数。
+        shards (int): 分片数，不为None时据此确定每个分片的月数，实际分片数可能更少。
+
+    Returns:
+        list: [(start, end)]，日期为%Y-%m-%d字符串。
+
+    """
+    day = datetime.datetime.strptime(start, '%Y-%m-%d')
+    te = datetime.datetime.strptime(end, '%Y-%m-%d')
+    if shards is not None:
+        total = (te.year - day.year) * 12 + te.month - day.month + 1
+        months = math.ceil(total / shards)
+
+    result = []
+    while day <= te:
+        shard_end = min(month_end(day, months), te)
+        result.append((day.strftime('%Y-%m-%d'), shard_end.strftime('%Y-%m-%d')))
+        day = shard_end + datetime.timedelta(days=1)
+    return result
+
+
+def write_shard_configs(shards, directory):
+    """
+    为每个分片写出一份配置文件，除起止日期外与当前配置相同。
+
+    Returns:
+        list: 配置文件路径。
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, (start, end) in enumerate(shards):
+        shard_config = configparser.ConfigParser()
+        shard_config.read_dict({section: dict(config.items(section, raw=True)) for section in config.sections()})
+        shard_config.set('time', 'start_date', start)
+        shard_config.set('time', 'end_date', end)
+        path = os.path.join(directory, f'shard_{str(i).zfill(3)}.ini')
+        with open(path, 'w') as f:
+            shard_config.write(f)
+        paths.append(path)
+    return paths
+
+
+def check_file(writer, name, times):
+    """
+    检查单个输出文件是否存在、时次是否与预期一致。写出中断的文件由manifest识别。
+
+    Returns:
+        str | None: 问题描述，无问题时返回None。
+
+    """
+    path = output_file(name)
+    if not os.path.exists(path):
+        return 'missing'
+    try:
+        found = writers[writer].read_times(path)
+    except (OSError, KeyError, ValueError) as e:
+        return f'unreadable: {e}'
+    if found is None:
+        return 'inconsistent TFLAG'
+    if found != times:
+        return (f'time steps {found[0] if found else None} .. {found[-1] if found else None} ({len(found)}), '
+                f'expected {times[0]} .. {times[-1]} ({len(times)})')
+    return None
+
+
+def check_target_day(manifest, target, day):
+    """
+    检查当前模拟域某输出目标某天的文件。
+
+    Returns:
+        list: [(文件名, 问题描述或None)]。
+
+    """
+    writer = writers[target.writer]
+    ts = writer.first_time(day)
+    signature = output_signature(target.writer, target.basedir,
+                                 [(year, month) for year, month, _ in target_months(target, day)])
+    result = []
+    for name, times in writer.expected_times(ts).items():
+        problem = check_file(target.writer, name, times)
+        if problem is None and name not in manifest.entries:
+            problem = 'not recorded as completed in the manifest'
+        elif problem is None and manifest.entries[name]['signature'] != signature:
+            problem = 'outdated, configuration or inputs changed since it was written'
+        result.append((name, problem))
+    return result
+
+
+def verify(targets, start, end):
+    """
+    检查起止日期内各模拟域各输出目标的文件：文件存在、时次（CMAQ的TFLAG、WRF-Chem的Times）与预期一致，
+    且manifest中记录为已完成、依赖签名与当前配置和输入一致。
+
+    Args:
+        targets (list): [Target]。
+        start (str): 起始日期，%Y-%m-%d。
+        end (str): 结束日期，%Y-%m-%d。
+
+    Returns:
+        tuple: (文件总数, [(文件名, 问题描述)])。
+
+    """
+    manifest = Manifest()
+    te = datetime.datetime.strptime(end, '%Y-%m-%d')
+
+    total = 0
+    problems = []
+    for domain in domain_names():
+        with use_domain(domain):
+            day = datetime.datetime.strptime(start, '%Y-%m-%d')
+            while day <= te:
+                for target in targets:
+                    for name, problem in check_target_day(manifest, target, day):
+                        total += 1
+                        if problem is not None:
+                            problems.append((name, problem))
+                day += datetime.timedelta(days=1)
+    return total, problems
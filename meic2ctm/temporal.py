@@ -0,0 +1,155 @@
+import numpy as np
+
+from .factor import calc_time_factors
+from .lazy import lazy_enabled, tile_rows
+from .meic import load_meic_month
+from .profiling import profiler
+
+
+def month_segments(times):
+    """
+    将连续的时刻按所在年月切分。
+
+    Returns:
+        list: [(year, month, start, stop)]，times[start:stop]属于同一个月。
+
+    """
+    segments = []
+    start = 0
+    for i in range(1, len(times) + 1):
+        if i == len(times) or (times[i].year, times[i].month) != (times[start].year, times[start].month):
+            segments.append((times[start].year, times[start].month, start, i))
+            start = i
+    return segments
+
+
+@profiler.timed('allocate')
+def allocate(surface, profiles, factors):
+    """
+    将某物种的分部门地面排放一次性分配到全部时刻和高度层，只计算权重非零的层。
+
+    Args:
+        surface (np.ndarray): (len(sectors), ROW, COL) 的地面排放。
+        profiles (np.ndarray): (len(sectors), LAY) 的垂直分配系数。
+        factors (np.ndarray): (len(sectors), TSTEP) 的时间分配系数。
+
+    Returns:
+        np.ndarray: (TSTEP, LAY, ROW, COL) 的float32数组。
+
+    """
+    weights = (factors.T[:, :, np.newaxis] * profiles[np.newaxis]).astype(np.float32)
+    layers = np.flatnonzero(weights.any(axis=(0, 1)))
+
+    result = np.zeros((factors.shape[1], profiles.shape[1], *surface.shape[1:]), dtype=np.float32)
+    result[:, layers] = np.tensordot(weights[:, :, layers], surface, axes=([1], [0]))
+    return result
+
+
+def iter_species_blocks(times, model_specs, basedir, sector=None):
+    """
+    逐物种生成整个文件时段的排放，跨月时各时刻使用所在月份的排放数据。
+
+    Args:
+        times (list): 文件内各时次的datetime。
+        model_specs (list): 模型物种。
+        basedir (str): 模型名称，对应factor下的目录。
+        sector (str): 只生成该部门的排放，为None时为全部部门之和。
+
+    Yields:
+        tuple: (spec, block)，block为 (len(times), LAY, ROW, COL) 的数组。
+
+    """
+    if lazy_enabled():
+        yield from iter_tiled_blocks(times, model_specs, basedir, sector)
+        return
+
+    segments = []
+    for year, month, start, stop in month_segments(times):
+        month_data = load_meic_month(year, month, basedir)
+        segments.append((month_data, calc_time_factors(month_data.sectors, times[start:stop])))
+
+    for spec in model_specs:
+        blocks = []
+        for month_data, factors in segments:
+            # 分部门输出时只取该部门的一项，与总量使用同一份月排放
+            selected = slice(None) if sector is None else [month_data.sectors.index(sector)]
+            blocks.append(allocate(month_data.surface[month_data.model_specs.index(spec)][selected],
+                                   month_data.profiles[selected], factors[selected]))
+        yield spec, blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+
+def allocate_step(tile, profiles, factors):
+    # 单个时次的分配，factors为 (len(sectors), 1)
+    return allocate(tile, profiles, factors)[0]
+
+
+def iter_tiled_blocks(times, model_specs, basedir, sector=None):
+    """
+    与iter_species_blocks相同，但block为按时次和网格行分块的dask数组，写出时才逐块计算。
+
+    Yields:
+        tuple: (spec, block)，block为 (len(times), LAY, ROW, COL) 的dask数组，每块为一个时次的若干行。
+
+    """
+    import dask.array as da
+
+    segments = []
+    for year, month, start, stop in month_segments(times):
+        month_data = load_meic_month(year, month, basedir)
+        segments.append((month_data, calc_time_factors(month_data.sectors, times[start:stop])))
+
+    for spec in model_specs:
+        steps = []
+        for month_data, factors in segments:
+            selected = slice(None) if sector is None else [month_data.sectors.index(sector)]
+            profiles = month_data.profiles[selected]
+            surface = da.from_array(month_data.surface[month_data.model_specs.index(spec)][selected],
+                                    chunks=(-1, tile_rows(), -1))
+            for step in range(factors.shape[1]):
+                steps.append(da.map_blocks(allocate_step, surface, profiles=profiles,
+                                           factors=factors[selected][:, step:step + 1], drop_axis=0, new_axis=0,
+                                           chunks=((profiles.shape[1],), *surface.chunks[1:]), dtype=np.float32))
+        yield spec, da.stack(steps)
+
+
+class OverlapCarry:
+    """
+    保存上一个文件中与下一个文件重叠的时次（如one_file_hours = 25时的第24时），
+    下一个文件直接复用这些时次的排放而不重新计算。
+    """
+
+    def __init__(self):
+        self.times = []
+        self.blocks = {}
+
+    def iter_species_blocks(self, times, model_specs, basedir, keep_from):
+        """
+        与iter_species_blocks相同，但开头与上一个文件重叠的时次直接复用。
+
+        Args:
+            times (list): 文件内各时次的datetime。
+            model_specs (list): 模型物种。
+            basedir (str): 模型名称，对应factor下的目录。
+            keep_from (datetime): 下一个文件的起始时刻，不早于该时刻的时次将保留给下一个文件。
+
+        """
+        reuse = 0
+        while reuse < len(times) and times[reuse] in self.times:
+            reuse += 1
+        previous_times, previous_blocks = self.times, self.blocks
+
+        keep = next((i for i, t in enumerate(times) if t >= keep_from), len(times))
+        self.times, self.blocks = times[keep:], {}
+
+        if reuse < len(times):
+            computed = iter_species_blocks(times[reuse:], model_specs, basedir)
+        else:
+            computed = ((spec, None) for spec in model_specs)
+
+        for spec, block in computed:
+            if reuse:
+                head = np.stack([previous_blocks[spec][previous_times.index(t)] for t in times[:reuse]])
+                block = head if block is None else np.concatenate([head, block])
+            if keep < len(times):
+                self.blocks[spec] = block[keep:].copy()
+            yield spec, block
@@ -0,0 +1,200 @@
+import os
+import datetime
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+from .cache import cache_dir, cache_key, file_signature
+from .config import config
+from .domain import domain_name
+from .factor import load_species_unit
+from .lazy import lazy_enabled, store_blocks
+from .meic import load_speciation_matrix
+from .output import (clone_output, create_output, output_file, output_format, netcdf_lock, tagged_sectors,
+                     variable_options)
+from .profiling import profiler
+from .temporal import iter_species_blocks
+
+
+def first_time(day):
+    # 每天的文件从0时开始
+    return day
+
+
+def file_times(ts):
+    return [ts + datetime.timedelta(hours=hour) for hour in range(0, 24)]
+
+
+def io_style():
+    # 对应WRF-Chem namelist中的io_style_emissions：1为00z/12z两个12时次文件，2为按日期命名的文件
+    return config.getint('wrfchem', 'io_style_emissions', fallback=2)
+
+
+def file_hours():
+    """
+    每个文件的时次数。io_style_emissions = 1 时为12，否则由 file_hours 配置，默认为1，需能整除24。
+    """
+    if io_style() == 1:
+        return 12
+    hours = config.getint('wrfchem', 'file_hours', fallback=1)
+    if hours <= 0 or 24 % hours:
+        raise ValueError(f'wrfchem file_hours must divide 24: {hours}')
+    return hours
+
+
+def file_starts():
+    # 当天各文件的起始小时
+    return list(range(0, 24, file_hours()))
+
+
+def file_name(ts, hour, sector=None):
+    if io_style() == 1:
+        # 00z/12z文件名不含日期，每天的文件位于以日期命名的子目录中
+        name = os.path.join(ts.strftime('%Y-%m-%d'), f'wrfchemi_{str(hour).zfill(2)}z_{domain_name()}')
+    else:
+        name = ts.strftime(f'wrfchemi_{domain_name()}_%Y-%m-%d') + "_" + str(hour).zfill(2) + "_00_00"
+    return name if sector is None else os.path.join(sector, name)
+
+
+def output_files(ts):
+    return [file_name(ts, hour, sector) for sector in [None, *tagged_sectors()] for hour in file_starts()]
+
+
+def expected_times(ts):
+    """
+    ts当天的各输出文件应包含的时次。
+
+    Returns:
+        dict: 文件名到 [datetime] 的映射。
+
+    """
+    times = file_times(ts)
+    return {file_name(ts, hour, sector): times[hour:hour + file_hours()]
+            for sector in [None, *tagged_sectors()] for hour in file_starts()}
+
+
+def read_times(path):
+    # 由Times读取文件中的时次
+    with nc.Dataset(path) as ncfile:
+        times = nc.chartostring(ncfile.variables['Times'][:])
+    return [datetime.datetime.strptime(str(t), '%Y-%m-%d_%H:%M:%S') for t in times]
+
+
+def create_template(path, model_specs, species_unit, basedir):
+    ncfile = create_output(path)
+
+    # 创建 LAY、ROW、COL 维度
+    layers = pd.read_csv(f"./factor/{basedir}/layer.csv").columns
+
+    ncfile.createDimension('Time', None)
+    ncfile.createDimension("DateStrLen", 19);
+    ncfile.createDimension('emissions_zdim', len(layers) - 1)
+
+    ncfile.createDimension('south_north', config.getint('projection', 'ycells'))
+    ncfile.createDimension('west_east', config.getint('projection', 'xcells'))
+
+    ncfile.setncattr("TITLE", "EMISSIONS for WRF-Chem");
+    ncfile.setncattr("MMINLU", "MODIFIED_IGBP_MODIS_NOAH");
+    ncfile.setncattr("NUM_LAND_CAT", 20);
+
+    # 创建新的变量，并指定维度
+    for spec in model_specs:
+        var = ncfile.createVariable("E_" + spec, 'f4', ('Time', 'emissions_zdim', 'south_north', 'west_east'),
+                                    **variable_options((1, len(layers) - 1, config.getint('projection', 'ycells'),
+                                                        config.getint('projection', 'xcells'))))
+
+        var.setncattr('description', 'EMISSIONS')
+        var.setncattr('units', species_unit[spec])
+        var.setncattr('coordinates', 'XLONG XLAT')
+        var.setncattr('stagger', '')
+        var.setncattr('MemoryOrder', 'XYZ')
+        var.setncattr('FieldType', 104)
+
+    ncfile.createVariable("Times", 'c', ('Time', 'DateStrLen'))
+    ncfile.close()
+
+
+def header_template(basedir):
+    """
+    只含维度、属性和变量定义的模板文件，位于缓存目录，按模型机制、物种单位、网格和输出格式区分。
+    每个输出文件由模板复制得到，不再逐个文件定义。
+
+    Returns:
+        str: 模板文件路径。
+
+    """
+    model_specs = load_speciation_matrix(basedir)[0]
+    species_unit = load_species_unit(basedir)
+    key = cache_key(basedir, model_specs, sorted(species_unit.items()), output_format(), variable_options((1,)),
+                    config.getint('projection', 'ycells'), config.getint('projection', 'xcells'),
+                    file_signature(f"./factor/{basedir}/layer.csv"))
+    path = os.path.join(cache_dir('wrfchem'), f'header.{key}.nc')
+    if not os.path.exists(path):
+        # 先写临时文件再改名，并行进程不会读到写了一半的模板
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        create_template(tmp_path, model_specs, species_unit, basedir)
+        os.replace(tmp_path, path)
+    return path
+
+
+def create_file(ts, hour, basedir, sector=None):
+    ncfile = clone_output(header_template(basedir), output_file(file_name(ts, hour, sector)))
+    times = file_times(ts)[hour:hour + file_hours()]
+    ncfile.variables['Times'][0:len(times)] = nc.stringtochar(
+        np.array([t.strftime('%Y-%m-%d_%H:00:00') for t in times], dtype='S19'))
+    return ncfile
+
+
+def write_day(ts, basedir, carry=None):
+    """
+    写出ts当天的WRF-Chem排放文件，每个文件 file_hours 个时次（io_style_emissions = 1 时为00z、12z两个文件），
+    tag_sectors = true 时同时写出各部门的文件。
+
+    Args:
+        ts (datetime): 当天0时。
+        basedir (str): 模型名称，对应factor下的目录。
+        carry (OverlapCarry): 跨文件复用重叠时次的排放，为None时不复用。
+
+    """
+    print(f'calc date: {ts.year}-{ts.month}-{ts.day}')
+    write_file(ts, basedir, None, carry)
+    # 分部门文件与总量使用同一份月排放，不重复读取输入
+    for sector in tagged_sectors():
+        write_file(ts, basedir, sector)
+
+
+def write_file(ts, basedir, sector, carry=None):
+    model_specs = load_speciation_matrix(basedir)[0]
+    cell_size = config.getfloat('projection', 'dx') / 1000 * config.getfloat('projection', 'dy') / 1000
+    hours = file_hours()
+    starts = file_starts()
+
+    # netCDF库非线程安全，与后台预读线程互斥访问
+    with netcdf_lock, profiler.stage('write_netcdf'):
+        ncfiles = [create_file(ts, hour, basedir, sector) for hour in starts]
+
+    # 整天各时次一次计算，跨月时各时次使用所在月份的meic数据
+    times = file_times(ts)
+    if carry is None:
+        blocks = iter_species_blocks(times, model_specs, basedir, sector)
+    else:
+        blocks = carry.iter_species_blocks(times, model_specs, basedir, ts + datetime.timedelta(days=1))
+
+    for spec, block in blocks:
+        if lazy_enabled():
+            # 逐块计算并写出，各时次写入对应的文件
+            with profiler.stage('write_netcdf'):
+                store_blocks([block[hour:hour + hours] / cell_size for hour in starts],
+                             [ncfile.variables["E_" + spec] for ncfile in ncfiles],
+                             [(slice(0, hours),)] * len(starts), netcdf_lock)
+            continue
+        block /= cell_size
+        with netcdf_lock, profiler.stage('write_netcdf'):
+            # 每个文件的全部时次一次写入
+            for hour, ncfile in zip(starts, ncfiles):
+                ncfile.variables["E_" + spec][0:hours] = block[hour:hour + hours]
+
+    with netcdf_lock, profiler.stage('write_netcdf'):
+        for ncfile in ncfiles:
+            ncfile.close()